@@ -0,0 +1,219 @@
+"""Google Sheets simulado en memoria para medir la app sin red ni credenciales.
+
+`FakeSpreadsheet` guarda cada pestaña como una lista de filas de texto y cuenta
+cada petición a la "API". Puede añadir latencia fija por petición, fallar con
+errores 429 al azar (`error_rate`) o al superar `quota_per_minute`, igual que
+la cuota real de Google.
+
+`install(spreadsheet, settings)` hace que `SheetsBackend` use
+`FakeGSheetsConnection` en lugar de la conexión real y deja los secrets en
+memoria, visibles desde cualquier hilo (también el de escritura en segundo plano).
+"""
+import random
+import threading
+import time
+from collections import Counter, deque
+
+import pandas as pd
+import streamlit as st
+from gspread.exceptions import APIError, WorksheetNotFound
+from gspread.utils import a1_to_rowcol
+from streamlit.connections import BaseConnection
+from streamlit.runtime.secrets import Secrets
+
+
+class FakeResponse:
+    """Lo mínimo de requests.Response que necesita gspread.exceptions.APIError"""
+
+    def __init__(self, status_code, message):
+        self.status_code = status_code
+        self.text = message
+
+    def json(self):
+        return {"error": {"code": self.status_code, "message": self.text, "status": "RESOURCE_EXHAUSTED"}}
+
+
+class FakeSpreadsheet:
+    def __init__(self, latency=0.0, error_rate=0.0, quota_per_minute=None, seed=0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.quota_per_minute = quota_per_minute
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.tabs = {}
+        self.calls = Counter()
+        self.errors = 0
+        self.recent = deque()
+
+    def api(self, method):
+        """Simula una petición: cuenta, espera la latencia y puede fallar con 429"""
+        with self.lock:
+            self.calls[method] += 1
+            now = time.monotonic()
+            while self.recent and now - self.recent[0] > 60:
+                self.recent.popleft()
+            self.recent.append(now)
+            over_quota = self.quota_per_minute is not None and len(self.recent) > self.quota_per_minute
+            failed = over_quota or self.rng.random() < self.error_rate
+            if failed:
+                self.errors += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if failed:
+            raise APIError(FakeResponse(429, "Quota exceeded (simulado)"))
+
+    def total_calls(self):
+        with self.lock:
+            return sum(self.calls.values())
+
+    def worksheet(self, name):
+        if name not in self.tabs:
+            raise WorksheetNotFound(name)
+        return self.tabs[name]
+
+    def add_worksheet(self, title, rows=1000, cols=26):
+        self.api("add_worksheet")
+        self.tabs[title] = FakeWorksheet(self, title, cols)
+        return self.tabs[title]
+
+    def load(self, name, df):
+        """Carga un DataFrame en una pestaña sin contar peticiones (para preparar datos)"""
+        ws = self.tabs.setdefault(name, FakeWorksheet(self, name, len(df.columns)))
+        ws.grid = [list(map(str, df.columns))] + [
+            ["" if pd.isna(v) else str(v) for v in row] for row in df.itertuples(index=False)
+        ]
+        ws.col_count = max(ws.col_count, len(df.columns))
+
+    def dataframe(self, name):
+        ws = self.worksheet(name)
+        if not ws.grid:
+            return pd.DataFrame()
+        header, rows = ws.grid[0], ws.grid[1:]
+        rows = [row + [""] * (len(header) - len(row)) for row in rows if any(row)]
+        return pd.DataFrame([row[:len(header)] for row in rows], columns=header).replace("", float("nan"))
+
+
+class FakeWorksheet:
+    """Las operaciones de gspread.Worksheet que usa SheetsBackend"""
+
+    def __init__(self, spreadsheet, title, cols):
+        self.spreadsheet = spreadsheet
+        self.title = title
+        self.grid = []
+        self.col_count = cols
+
+    def _set(self, row, col, value):
+        while len(self.grid) < row:
+            self.grid.append([])
+        cells = self.grid[row - 1]
+        while len(cells) < col:
+            cells.append("")
+        cells[col - 1] = "" if value is None else str(value)
+
+    def row_values(self, row):
+        self.spreadsheet.api("row_values")
+        return list(self.grid[row - 1]) if len(self.grid) >= row else []
+
+    def col_values(self, col):
+        self.spreadsheet.api("col_values")
+        values = [row[col - 1] if len(row) >= col else "" for row in self.grid]
+        while values and not values[-1]:
+            values.pop()
+        return values
+
+    def batch_get(self, ranges, **kwargs):
+        self.spreadsheet.api("batch_get")
+        result = []
+        for a1 in ranges:
+            if ":" in a1:  # fila completa, p.ej. "1:1"
+                row = int(a1.split(":")[0])
+                values = list(self.grid[row - 1]) if len(self.grid) >= row else []
+                while values and not values[-1]:
+                    values.pop()
+                result.append([values] if values else [])
+            else:
+                row, col = a1_to_rowcol(a1)
+                cells = self.grid[row - 1] if len(self.grid) >= row else []
+                value = cells[col - 1] if len(cells) >= col else ""
+                result.append([[value]] if value else [])
+        return result
+
+    def delete_columns(self, start, end=None):
+        self.spreadsheet.api("delete_columns")
+        end = end or start
+        self.grid = [row[:start - 1] + row[end:] for row in self.grid]
+        self.col_count -= end - start + 1
+
+    def add_cols(self, cols):
+        self.spreadsheet.api("add_cols")
+        self.col_count += cols
+
+    def batch_update(self, data, **kwargs):
+        self.spreadsheet.api("batch_update")
+        for update in data:
+            row, col = a1_to_rowcol(update["range"])
+            if col > self.col_count:
+                raise APIError(FakeResponse(400, "Range exceeds grid limits"))
+            self._set(row, col, update["values"][0][0])
+
+    def append_rows(self, values, **kwargs):
+        self.spreadsheet.api("append_rows")
+        first = len(self.grid) + 1
+        for row in values:
+            self.grid.append(["" if v is None else str(v) for v in row])
+        return {"updates": {"updatedRange": f"{self.title}!A{first}:A{len(self.grid)}"}}
+
+
+class FakeClient:
+    """Cliente al estilo de GSheetsServiceAccountClient sobre el FakeSpreadsheet instalado"""
+
+    @property
+    def spreadsheet(self):
+        return FakeGSheetsConnection.spreadsheet
+
+    def _select_worksheet(self, worksheet=None, **kwargs):
+        self.spreadsheet.api("get_worksheet")
+        return self.spreadsheet.worksheet(worksheet)
+
+    def _open_spreadsheet(self, **kwargs):
+        self.spreadsheet.api("open_spreadsheet")
+        return self.spreadsheet
+
+    def read(self, worksheet=None, **kwargs):
+        self.spreadsheet.api("read")
+        return self.spreadsheet.dataframe(worksheet)
+
+    def update(self, worksheet=None, data=None, **kwargs):
+        self.spreadsheet.api("update")
+        self.spreadsheet.load(getattr(worksheet, "title", worksheet), data)
+        return data
+
+
+class FakeGSheetsConnection(BaseConnection[FakeClient]):
+    """Sustituto de GSheetsConnection para st.connection"""
+
+    spreadsheet = FakeSpreadsheet()
+
+    def _connect(self, **kwargs):
+        return FakeClient()
+
+    @property
+    def client(self):
+        return self._instance
+
+    def read(self, **kwargs):
+        return self._instance.read(**kwargs)
+
+    def update(self, **kwargs):
+        return self._instance.update(**kwargs)
+
+
+def install(spreadsheet, settings):
+    """Usa `spreadsheet` como Google Sheets y `settings` como secrets de la app"""
+    import utils.sheets
+
+    FakeGSheetsConnection.spreadsheet = spreadsheet
+    utils.sheets.GSheetsConnection = FakeGSheetsConnection
+    secrets = Secrets()
+    secrets._secrets = settings
+    st.secrets = secrets
@@ -0,0 +1,325 @@
+"""Benchmark offline de la porra sobre un Google Sheets simulado (ver bench/fake_sheets.py).
+
+    python -m bench.run --players 10 100 1000 --output baseline.json
+    python -m bench.run --players 100 --latency 0.2 --compare baseline.json
+
+Para cada tamaño de grupo prepara una hoja con N jugadores y mide:
+  - save_step_ms: latencia de guardar cada paso del asistente con GameDB (p50/p95)
+  - queue_ms / flush_ms: lo que tarda el autoguardado en segundo plano en encolar y en escribirse
+  - api_calls_per_rerun: peticiones a Sheets por rerun de la página de predicciones (AppTest)
+  - admin_render_ms / admin_api_calls: render del panel de admin en frío y en caliente
+  - leaderboard_ms: clasificación al introducir resultados (en frío e incremental)
+  - peak_memory_mb: pico de memoria (tracemalloc) de un render en frío del admin
+
+El resultado es un JSON; con --compare se imprime además la diferencia con otro JSON.
+"""
+import argparse
+import json
+import logging
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+import pandas as pd
+import streamlit as st
+from streamlit.testing.v1 import AppTest
+
+from bench.fake_sheets import FakeSpreadsheet, install
+from utils.insights import GROUP_COLUMNS
+
+ROOT = Path(__file__).resolve().parent.parent
+ADMIN_PAGE = str(next(ROOT.glob("pages/1_*.py")))
+PREDICTIONS_PAGE = str(next(ROOT.glob("pages/2_*.py")))
+PASSWORD = "bench"
+OPINIONS_PER_PLAYER = 5
+
+WORDS = ["Intenso", "Viajes", "Cambio", "Tranquilo", "Caótico", "Feliz", "Duro", "Épico", "Mudanza", "Fiesta"]
+TEAMS = ["España", "Argentina", "Francia", "Brasil", "Real Madrid", "Barça", "Atleti", "PSG", "City"]
+ANSWERS = ["Sí", "No", "Tal vez"]
+
+
+def player_names(n):
+    return [f"Jugador {i:04d}" for i in range(1, n + 1)]
+
+
+def step_payloads(player, players, rng):
+    """Lo que guarda save_progress en cada paso: solo los campos rellenados en ese paso"""
+    others = [p for p in players if p != player]
+    return [
+        {'Palabra 2025': rng.choice(WORDS), 'Descripcion 2025': f"Un año {rng.choice(WORDS).lower()}",
+         'Momento Top 2025': f"{rng.choice(WORDS)} en verano"},
+        {'Palabra 2026': rng.choice(WORDS), 'Expectativa 2026': f"Más {rng.choice(WORDS).lower()}"},
+        {'Ganador Mundial': rng.choice(TEAMS), 'Ganador Champions': rng.choice(TEAMS),
+         'Ganador Liga': rng.choice(TEAMS), 'Elecciones España': rng.choice(ANSWERS), 'Necroporra': "Nadie"},
+        {column: rng.choice(players) for column in GROUP_COLUMNS},
+        {f"Sobre {person}": f"Le irá {rng.choice(WORDS).lower()}"
+         for person in rng.sample(others, min(OPINIONS_PER_PLAYER, len(others)))},
+    ]
+
+
+def seed(spreadsheet, players, answered, rng):
+    """Carga Players, Predictions (de los que ya han respondido) y Opinions sin contar peticiones"""
+    spreadsheet.load("Players", pd.DataFrame({"Nombre": players}))
+    predictions, opinions = [], []
+    for player in answered:
+        row = {'Jugador': player, 'Foto Momentos': "No subida", 'Timestamp': "2026-01-01 00:00:00"}
+        for step in step_payloads(player, players, rng):
+            for key, value in step.items():
+                if key.startswith("Sobre "):
+                    opinions.append({'Autor': player, 'Sujeto': key[len("Sobre "):], 'Texto': value,
+                                     'Timestamp': row['Timestamp']})
+                else:
+                    row[key] = value
+        predictions.append(row)
+    spreadsheet.load("Predictions", pd.DataFrame(predictions))
+    spreadsheet.load("Opinions", pd.DataFrame(opinions, columns=['Autor', 'Sujeto', 'Texto', 'Timestamp']))
+
+
+def reset_caches():
+    """Arranque en frío: sin conexión, sin lecturas cacheadas y sin imágenes ya generadas"""
+    import utils.database
+    import utils.word_cloud
+
+    utils.database._group_pool().clear()
+    utils.database._schedulers.clear()
+    st.cache_resource.clear()
+    st.cache_data.clear()
+    with utils.word_cloud._lock:
+        utils.word_cloud._renders.clear()
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    if not samples:
+        return {}
+    p95 = samples[min(len(samples) - 1, round(0.95 * (len(samples) - 1)))]
+    return {"p50": statistics.median(samples), "p95": p95, "max": samples[-1], "n": len(samples)}
+
+
+def bench_saves(spreadsheet, players, sampled, rng):
+    """Guardado síncrono de cada paso (lo que hace el hilo de escritura) y autoguardado en cola"""
+    from utils.database import get_db
+
+    db = get_db()
+    steps = {f"paso {i}": [] for i in range(1, 6)}
+    calls = []
+    for player in sampled:
+        for i, payload in enumerate(step_payloads(player, players, rng), start=1):
+            data = {'Jugador': player, **payload, 'Timestamp': time.strftime("%Y-%m-%d %H:%M:%S")}
+            before = spreadsheet.total_calls()
+            start = time.perf_counter()
+            db.save_prediction(data)
+            steps[f"paso {i}"].append((time.perf_counter() - start) * 1000)
+            calls.append(spreadsheet.total_calls() - before)
+
+    queued, flushed = [], []
+    for player in sampled:
+        payloads = step_payloads(player, players, rng)
+        start = time.perf_counter()
+        for payload in payloads:
+            db.queue_prediction({'Jugador': player, **payload})
+        queued.append((time.perf_counter() - start) * 1000 / len(payloads))
+        start = time.perf_counter()
+        db.flush_predictions(player)
+        flushed.append((time.perf_counter() - start) * 1000)
+
+    return {
+        "save_step_ms": {**{step: percentiles(ms) for step, ms in steps.items()},
+                         "todos": percentiles([ms for step in steps.values() for ms in step])},
+        "api_calls_per_save": statistics.mean(calls),
+        "queue_ms": percentiles(queued),
+        "flush_ms": percentiles(flushed),
+    }
+
+
+def bench_wizard(spreadsheet, player):
+    """Recorre el asistente con AppTest y cuenta las peticiones de cada rerun (incluida su escritura)"""
+    from utils.database import get_db
+
+    reruns = []
+
+    def rerun(label, action):
+        before = spreadsheet.total_calls()
+        action()
+        get_db().flush_predictions()
+        if at.exception:
+            raise RuntimeError(f"{label}: {[e.value for e in at.exception]}")
+        reruns.append({"rerun": label, "api_calls": spreadsheet.total_calls() - before})
+
+    def button(text):
+        return next(b for b in at.button if text in b.label)
+
+    at = AppTest.from_file(PREDICTIONS_PAGE, default_timeout=300)
+    rerun("inicio", at.run)
+    at.selectbox[0].select(player)
+    rerun("comenzar", lambda: at.button[0].click().run())
+    for step in range(1, 5):
+        if at.text_input:
+            at.text_input[0].input(f"Respuesta {step}")
+        else:
+            at.selectbox[0].select(player)
+        rerun(f"paso {step}", lambda: button("Siguiente").click().run())
+    for text_area in at.text_area[:OPINIONS_PER_PLAYER]:
+        text_area.input("Le irá bien")
+    rerun("finalizar", lambda: button("Finalizar").click().run())
+
+    return {"api_calls_per_rerun": reruns,
+            "api_calls_per_rerun_mean": statistics.mean(r["api_calls"] for r in reruns)}
+
+
+def render_admin(spreadsheet):
+    """Render del admin ya autenticado: (ms, peticiones) en frío y en caliente"""
+    at = AppTest.from_file(ADMIN_PAGE, default_timeout=300).run()
+    results = {}
+    for label, action in [("frio", lambda: at.sidebar.text_input[0].input(PASSWORD).run()),
+                          ("caliente", at.run)]:
+        before = spreadsheet.total_calls()
+        start = time.perf_counter()
+        action()
+        results[label] = ((time.perf_counter() - start) * 1000, spreadsheet.total_calls() - before)
+        if at.exception:
+            raise RuntimeError(f"admin {label}: {[e.value for e in at.exception]}")
+    return results
+
+
+def bench_leaderboard():
+    """Clasificación al introducir los resultados uno a uno: el primero construye el motor,
+    los siguientes solo recalculan la pregunta que cambia"""
+    from utils.database import get_db
+    from utils.scoring import SCORED_COLUMNS, leaderboard
+
+    db = get_db()
+    data = db.get_all_predictions()
+    timings = []
+    for question in [q for q in SCORED_COLUMNS if q in data.columns]:
+        answer = data[question].dropna().iloc[0]
+        db.save_result({'Pregunta': question, 'Resultado': answer, 'Alias': "", 'Puntos': 1,
+                        'Timestamp': time.strftime("%Y-%m-%d %H:%M:%S")})
+        results = db.get_results()
+        start = time.perf_counter()
+        leaderboard(data, results)
+        timings.append((time.perf_counter() - start) * 1000)
+    return {"frio": timings[0], "incremental": percentiles(timings[1:])}
+
+
+def bench_size(n, args):
+    rng = random.Random(args.seed)
+    players = player_names(n)
+    sampled = players[:min(args.samples, n)]
+    spreadsheet = FakeSpreadsheet(latency=args.latency, error_rate=args.error_rate,
+                                  quota_per_minute=args.quota_per_minute, seed=args.seed)
+    install(spreadsheet, {
+        "general": {"admin_password": PASSWORD},
+        "storage": {"backend": "gsheets", "cache_ttl": args.cache_ttl,
+                    "requests_per_minute": args.requests_per_minute},
+    })
+    # Los jugadores de la muestra todavía no han respondido: su primer guardado es una fila nueva
+    seed(spreadsheet, players, players[len(sampled):], rng)
+
+    reset_caches()
+    result = bench_saves(spreadsheet, players, sampled, rng)
+
+    reset_caches()
+    result.update(bench_wizard(spreadsheet, players[-1]))
+
+    reset_caches()
+    admin = render_admin(spreadsheet)
+    result["admin_render_ms"] = {label: ms for label, (ms, _) in admin.items()}
+    result["admin_api_calls"] = {label: calls for label, (_, calls) in admin.items()}
+    result["leaderboard_ms"] = bench_leaderboard()
+
+    reset_caches()
+    tracemalloc.start()
+    render_admin(spreadsheet)
+    result["peak_memory_mb"] = tracemalloc.get_traced_memory()[1] / 2**20
+    tracemalloc.stop()
+
+    result["api_calls_total"] = dict(spreadsheet.calls)
+    result["api_errors"] = spreadsheet.errors
+    reset_caches()
+    return result
+
+
+def flatten(data, prefix=""):
+    """{'a': {'b': 1}} -> {'a.b': 1}, solo valores numéricos"""
+    flat = {}
+    if isinstance(data, dict):
+        for key, value in data.items():
+            flat.update(flatten(value, f"{prefix}{key}."))
+    elif isinstance(data, list):
+        for item in data:
+            if isinstance(item, dict) and "rerun" in item:
+                flat.update(flatten({k: v for k, v in item.items() if k != "rerun"}, f"{prefix}{item['rerun']}."))
+    elif isinstance(data, (int, float)) and not isinstance(data, bool):
+        flat[prefix[:-1]] = data
+    return flat
+
+
+def compare(old, new):
+    """Tabla con las métricas que cambian entre dos resultados"""
+    before, after = flatten(old["results"]), flatten(new["results"])
+    lines = [f"{'métrica':<60} {'antes':>12} {'ahora':>12} {'cambio':>8}"]
+    for key in sorted(before.keys() & after.keys()):
+        a, b = before[key], after[key]
+        if a == b:
+            continue
+        change = f"{(b - a) / a * 100:+.0f}%" if a else "nuevo"
+        lines.append(f"{key:<60} {a:>12.2f} {b:>12.2f} {change:>8}")
+    return "\n".join(lines)
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--players", type=int, nargs="+", default=[10, 100, 1000], help="tamaños de grupo")
+    parser.add_argument("--samples", type=int, default=10, help="jugadores que guardan el asistente completo")
+    parser.add_argument("--latency", type=float, default=0.1, help="segundos por petición simulada")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="probabilidad de un 429 por petición")
+    parser.add_argument("--quota-per-minute", type=int, default=None, help="cuota simulada de Google (429 al pasarla)")
+    parser.add_argument("--requests-per-minute", type=int, default=6000, help="límite del RequestScheduler de la app")
+    parser.add_argument("--cache-ttl", type=float, default=30, help="cache_ttl de [storage]")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="fichero JSON de salida (por defecto, stdout)")
+    parser.add_argument("--compare", help="JSON de una ejecución anterior con el que comparar")
+    args = parser.parse_args(argv)
+    # Sin los avisos de Streamlit (deprecaciones, "No runtime found"...) en cada rerun de AppTest
+    logging.disable(logging.WARNING)
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "settings": {k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+        },
+        "results": {},
+    }
+    for n in args.players:
+        print(f"[bench] {n} jugadores...", file=sys.stderr)
+        start = time.perf_counter()
+        report["results"][str(n)] = bench_size(n, args)
+        print(f"[bench] {n} jugadores en {time.perf_counter() - start:.1f} s", file=sys.stderr)
+
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        Path(args.output).write_text(text + "\n", encoding="utf-8")
+    else:
+        print(text)
+    if args.compare:
+        print(compare(json.loads(Path(args.compare).read_text(encoding="utf-8")), report), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,12 @@
 import streamlit as st
-import pandas as pd
-from utils.database import GameDB
-import plotly.express as px
+from utils.profiling import startup_profile
+
+profile = startup_profile("Admin")
+
+from utils.database import StorageError, get_db
+from utils.groups import group_settings, require_group
+from utils.metrics import WINDOW, metrics, timed
+from utils.opinions import is_opinion_column
 
 st.set_page_config(page_title="Admin Panel", page_icon="⚙️")
 
@@ -16,117 +21,117 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-def get_db():
-    return GameDB()
+def load_data(loader, what):
+    """Resultado de loader() o, si falla el almacenamiento, un DataFrame vacío y el error en pantalla.
+
+    `what` es lo que se carga, para el mensaje ("las predicciones", "los resultados"...).
+    """
+    try:
+        return loader()
+    except StorageError as e:
+        st.error(f"No se pudieron cargar {what}: {e}")
+        import pandas as pd
+        return pd.DataFrame()
 
 def admin_page():
     st.title("⚙️ Panel de Control")
-    db = get_db()
-    # Autenticación desde secrets.toml
+    profile.mark("primer pintado")
+    group = require_group()
+    settings = group_settings(group)
+    db = get_db(group)
+    # Autenticación desde secrets.toml (cada grupo tiene su contraseña)
     password = st.sidebar.text_input("Contraseña de Admin", type="password")
-    admin_pass = st.secrets.get("general", {}).get("admin_password", "2026")
+    admin_pass = settings["admin_password"]
     
     if password != admin_pass:
         st.warning("Introduce la contraseña correcta en la barra lateral para acceder.")
         return
 
-    tab1, tab2, tab3 = st.tabs(["👥 Jugadores", "📊 Insights", "📂 Datos Crudos"])
+    tab1, tab2, tab3, tab4, tab5 = st.tabs(["👥 Jugadores", "📊 Insights", "🏆 Clasificación", "📂 Datos Crudos",
+                                            "⏱️ Rendimiento"])
 
     with tab1:
         st.subheader("Gestión de Jugadores")
         new_player = st.text_input("Nombre del nuevo jugador")
         if st.button("Añadir Jugador"):
             if new_player:
-                db.save_player(new_player)
-                st.success(f"Jugador {new_player} añadido!")
-                st.rerun()
+                try:
+                    db.save_player(new_player)
+                except StorageError as e:
+                    st.error(f"No se pudo añadir el jugador: {e}")
+                else:
+                    st.success(f"Jugador {new_player} añadido!")
+                    st.rerun()
         
-        players = db.get_players()
+        try:
+            players = db.get_players()
+        except StorageError as e:
+            st.error(f"No se pudo cargar la lista de jugadores: {e}")
+            players = []
         st.write("Jugadores actuales:")
         st.dataframe(players)
 
     with tab2:
         st.subheader("📊 Insights del Grupo")
-        data = db.get_all_predictions()
+        data = load_data(db.get_all_predictions, "las predicciones")
+        opinions = load_data(db.get_opinions, "las opiniones")
         
         if not data.empty:
+            # pandas/plotly solo se cargan aquí, pasada la contraseña
+            import pandas as pd
+            from utils.insights import WORLD_COLUMNS, insights_snapshot
+
+            # Todos los recuentos en una pasada, memoizados por contenido
+            snapshot = insights_snapshot(data, opinions)
+
             # 🖼️ MOODBOARD GALLERY
             st.markdown("### 🖼️ Galería de Auras 2026")
             
             # Crear collage con PIL si se solicita
             if st.button("🎨 Generar Collage del Grupo"):
-                from PIL import Image, ImageDraw, ImageFont
-                import io
-                
-                # Configuración del collage
-                cols = 4
-                rows = (len(data) + cols - 1) // cols
-                tile_size = 200
-                img = Image.new('RGB', (cols * tile_size, rows * tile_size), color='#1e1e2f')
-                draw = ImageDraw.Draw(img)
+                from utils.collage import collage_png
                 
-                for i, (_, row) in enumerate(data.iterrows()):
-                    r, c = divmod(i, cols)
-                    x, y = c * tile_size, r * tile_size
-                    color = row.get('Mood Color', '#ff4b2b')
-                    
-                    # Dibujar cuadrado de color
-                    draw.rectangle([x, y, x + tile_size, y + tile_size], fill=color)
-                    
-                    # Añadir nombre y emoji (simplificado sin fuentes externas para evitar errores)
-                    name = row['Jugador'][:10]
-                    emoji = row.get('Mood Emoji', '✨')
-                    draw.text((x + 10, y + 10), f"{emoji}\n{name}", fill='white')
-                
-                # Mostrar y permitir descarga
-                buf = io.BytesIO()
-                img.save(buf, format='PNG')
-                st.image(img, caption="Collage de Auras 2026")
-                st.download_button("📥 Descargar Collage", buf.getvalue(), "collage_2026.png", "image/png")
+                # PNG cacheado: solo se regenera si cambian jugadores, colores o emojis
+                with timed("admin.collage"):
+                    png = collage_png(data)
+                    st.image(png, caption="Collage de Auras 2026")
+                    st.download_button("📥 Descargar Collage", png, "collage_2026.png", "image/png")
 
             st.divider()
             
             # Resto de Insights
             col1, col2 = st.columns(2)
             
+            cloud = None
             with col1:
                 st.markdown("**🔮 El 2026 en una palabra**")
-                palabras = " ".join(data['Palabra 2026'].dropna().astype(str))
-                palabras = palabras.replace("Saltado", "")
                 
-                if palabras.strip():
-                    from wordcloud import WordCloud
+                if snapshot.word_frequencies:
+                    from utils.word_cloud import word_cloud_png
                     
-                    wordcloud = WordCloud(width=800, height=400, background_color='black', 
-                                         colormap='magma', max_words=50).generate(palabras)
-                    
-                    st.image(wordcloud.to_image(), use_container_width=True)
+                    # Se calcula en segundo plano; el resto de la página se pinta mientras tanto
+                    cloud = word_cloud_png(snapshot.word_frequencies)
+                    cloud_slot = st.empty()
+                    if not cloud.done():
+                        cloud_slot.info("☁️ Generando la nube de palabras...")
 
 
             # --- SECCIÓN 1: EL MUNDO EN 2026 ---
             st.markdown("### 🌍 El Mundo en 2026")
             col_m1, col_m2, col_m3 = st.columns(3)
             
-            def get_top_vote(column_name):
-                if column_name in data.columns:
-                    counts = data[column_name].value_counts()
-                    if not counts.empty:
-                        return counts.index[0], counts.values[0]
-                return "N/A", 0
-
             with col_m1:
-                top_m, v_m = get_top_vote('Ganador Mundial')
+                top_m, v_m = snapshot.top_vote('Ganador Mundial')
                 st.metric("Favorito Mundial ⚽", top_m, f"{v_m} votos")
             with col_m2:
-                top_c, v_c = get_top_vote('Ganador Champions')
+                top_c, v_c = snapshot.top_vote('Ganador Champions')
                 st.metric("Favorito Champions 🏆", top_c, f"{v_c} votos")
             with col_m3:
-                top_l, v_l = get_top_vote('Ganador Liga')
+                top_l, v_l = snapshot.top_vote('Ganador Liga')
                 st.metric("Favorito Liga 🇪🇸", top_l, f"{v_l} votos")
 
             with st.expander("Ver todas las predicciones mundiales (Necroporra, Elecciones...)"):
-                world_cols = ['Ganador Mundial', 'Ganador Champions', 'Ganador Liga', 'Ganador SuperBowl', 'Elecciones España', 'Necroporra', 'Mision Artemis', 'Avengers Hit', 'Bombazo Famosos']
-                available_cols = [c for c in world_cols if c in data.columns]
+                available_cols = [c for c in WORLD_COLUMNS if c in data.columns]
                 if available_players := data['Jugador'].tolist():
                     for idx, row in data.iterrows():
                         st.markdown(f"**{row['Jugador']}**")
@@ -138,7 +143,7 @@ def admin_page():
             st.divider()
 
             # --- SECCIÓN 2: PREDICCIONES GRUPALES ---
-            st.markdown("### 🫂 Porra de Grupo (NPM)")
+            st.markdown(f"### 🫂 Porra de Grupo ({settings['name']})")
             
             group_keys = [
                 ('Noticia Importante', '#ff4b2b'),
@@ -150,23 +155,14 @@ def admin_page():
                 ('Comprara Coche', '#f2994a')
             ]
             
-            # Mostrar en una cuadrícula de 2 columnas
-            for i in range(0, len(group_keys), 2):
-                c1, c2 = st.columns(2)
-                for j, (key, color) in enumerate(group_keys[i:i+2]):
-                    col = c1 if j == 0 else c2
-                    with col:
-                        if key in data.columns:
-                            st.markdown(f"**🎯 {key}**")
-                            counts = data[key].value_counts()
-                            if "" in counts.index: counts = counts.drop("")
-                            if not counts.empty:
-                                fig = px.bar(counts, x=counts.index, y=counts.values, 
-                                             color_discrete_sequence=[color])
-                                fig.update_layout(height=250, margin=dict(t=0, b=0, l=0, r=0))
-                                st.plotly_chart(fig, use_container_width=True)
-                        else:
-                            st.write(f"Sin datos de {key}")
+            # Una sola figura en cuadrícula de 2 columnas, cacheada por los recuentos
+            with timed("admin.gráficos"):
+                from utils.charts import votes_figure
+                answered = [(key, color) for key, color in group_keys if key in data.columns]
+                if answered:
+                    st.plotly_chart(votes_figure(snapshot, answered), use_container_width=True)
+                if missing := [key for key, _ in group_keys if key not in data.columns]:
+                    st.write(f"Sin datos de {', '.join(missing)}")
 
             st.divider()
 
@@ -177,46 +173,155 @@ def admin_page():
             selected_p = st.selectbox("Selecciona un jugador para ver su reporte completo:", players_list)
             
             if selected_p:
-                p_row = data[data['Jugador'] == selected_p].iloc[0]
-                col_p1, col_p2 = st.columns(2)
+                with timed("admin.reporte"):
+                    p_row = snapshot.player_row(selected_p)
+                    col_p1, col_p2 = st.columns(2)
                 
-                with col_p1:
-                    st.markdown(f"#### El 2025 de {selected_p}")
-                    st.write(f"**Palabra:** {p_row.get('Palabra 2025', 'N/A')}")
-                    st.write(f"**¿Cómo le ha ido?:** {p_row.get('Descripcion 2025', 'N/A')}")
-                    st.write(f"**Momento TOP:** {p_row.get('Momento Top 2025', 'N/A')}")
+                    with col_p1:
+                        st.markdown(f"#### El 2025 de {selected_p}")
+                        st.write(f"**Palabra:** {p_row.get('Palabra 2025', 'N/A')}")
+                        st.write(f"**¿Cómo le ha ido?:** {p_row.get('Descripcion 2025', 'N/A')}")
+                        st.write(f"**Momento TOP:** {p_row.get('Momento Top 2025', 'N/A')}")
+                        from utils.photos import thumbnail
+                        if photo := thumbnail(p_row.get('Foto ID')):
+                            st.image(photo, caption="Foto del momento TOP", width=256)
                 
-                with col_p2:
-                    st.markdown(f"#### El 2026 de {selected_p}")
-                    st.write(f"**Palabra:** {p_row.get('Palabra 2026', 'N/A')}")
-                    st.write(f"**Expectativa:** {p_row.get('Expectativa 2026', 'N/A')}")
+                    with col_p2:
+                        st.markdown(f"#### El 2026 de {selected_p}")
+                        st.write(f"**Palabra:** {p_row.get('Palabra 2026', 'N/A')}")
+                        st.write(f"**Expectativa:** {p_row.get('Expectativa 2026', 'N/A')}")
                 
-                st.markdown("#### 💌 Lo que dicen los demás sobre él/ella:")
-                for other_p in players_list:
-                    if other_p != selected_p:
-                        col_key = f"Sobre {selected_p}"
-                        if col_key in data.columns:
-                            other_row = data[data['Jugador'] == other_p].iloc[0]
-                            opinion = other_row.get(col_key)
-                            if opinion and opinion != "Saltado":
-                                with st.chat_message(other_p):
-                                    st.write(f"**Para {selected_p}:** {opinion}")
+                    st.markdown("#### 💌 Lo que dicen los demás sobre él/ella:")
+                    for other_p, opinion in snapshot.opinions_about(selected_p).items():
+                        with st.chat_message(other_p):
+                            st.write(f"**Para {selected_p}:** {opinion}")
+
+            if cloud is not None:
+                # Lo que la página espera a que termine la nube (0 si ya estaba hecha)
+                with timed("admin.nube"):
+                    from concurrent.futures import TimeoutError as FutureTimeout
+                    from utils.word_cloud import RENDER_TIMEOUT
+                    try:
+                        cloud_slot.image(cloud.result(timeout=RENDER_TIMEOUT), use_container_width=True)
+                    except FutureTimeout:
+                        cloud_slot.warning("☁️ La nube de palabras está tardando demasiado; recarga en un rato.")
+                    except Exception as e:
+                        # Un fallo no se cachea: se vuelve a intentar en la siguiente carga
+                        cloud_slot.error(f"No se pudo generar la nube de palabras: {e}")
 
         else:
             st.write("Aún no hay datos para mostrar insights.")
 
     with tab3:
+        st.subheader("🏆 Clasificación")
+        import datetime
+        from utils.scoring import SCORED_COLUMNS, leaderboard
+
+        with st.form("resultado", enter_to_submit=False):
+            st.markdown("**Introducir un resultado real**")
+            question = st.selectbox("Pregunta", SCORED_COLUMNS)
+            answer = st.text_input("Resultado (déjalo vacío para quitarlo)")
+            aliases = st.text_input("Otras formas de escribirlo, separadas por ';'", placeholder="R. Madrid; Madrid")
+            points = st.number_input("Puntos por acierto", min_value=0.0, value=1.0, step=0.5)
+            if st.form_submit_button("💾 Guardar resultado"):
+                try:
+                    db.save_result({'Pregunta': question, 'Resultado': answer.strip(), 'Alias': aliases.strip(),
+                                    'Puntos': points,
+                                    'Timestamp': datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")})
+                except StorageError as e:
+                    st.error(f"No se pudo guardar el resultado: {e}")
+                else:
+                    st.rerun()
+
+        results = load_data(db.get_results, "los resultados")
+        data = load_data(db.get_all_predictions, "las predicciones")
+        if data.empty or 'Jugador' not in data.columns:
+            st.write("Aún no hay predicciones que puntuar.")
+        else:
+            board = leaderboard(data, results)
+            st.caption(f"{board.attrs['resueltas']} de {board.attrs['preguntas']} preguntas con resultado")
+            st.dataframe(board, hide_index=True)
+        if not results.empty:
+            with st.expander("Resultados introducidos"):
+                st.dataframe(results, hide_index=True)
+
+    with tab4:
         st.subheader("Descargar Datos")
-        data = db.get_all_predictions()
+        legacy = [c for c in load_data(db.get_all_predictions, "las predicciones").columns if is_opinion_column(c)]
+        if legacy:
+            st.info(f"'Predictions' aún tiene {len(legacy)} columnas 'Sobre ...' del formato antiguo.")
+            if st.button("🔄 Migrar opiniones a la pestaña Opinions"):
+                try:
+                    migrated = db.migrate_opinions()
+                except StorageError as e:
+                    st.error(f"No se pudo migrar: {e}")
+                else:
+                    st.success(f"{migrated} opiniones migradas")
+                    st.rerun()
+
+        # Vista ancha (una columna 'Sobre X' por persona) reconstruida solo para exportar
+        data = load_data(db.get_wide_predictions, "las predicciones")
         if not data.empty:
             st.dataframe(data)
-            csv = data.to_csv(index=False).encode('utf-8')
-            st.download_button(
-                "Descargar CSV",
-                csv,
-                "predicciones_2026.csv",
-                "text/csv"
-            )
+            from utils.exports import bundle_export, csv_export, parquet_available, parquet_export
+            from utils.opinions import merge_opinions
+
+            def bundle():
+                predictions = db.get_all_predictions()
+                return bundle_export({
+                    "predicciones.csv": predictions[[c for c in predictions.columns if not is_opinion_column(c)]],
+                    "opiniones.csv": merge_opinions(predictions, db.get_opinions()),
+                    "resultados.csv": db.get_results(),
+                })
+
+            # Los ficheros se generan al pulsar (en otro hilo) y se reutilizan mientras no cambien los datos
+            col_d1, col_d2, col_d3 = st.columns(3)
+            with col_d1:
+                st.download_button("Descargar CSV", lambda: csv_export(data), "predicciones_2026.csv",
+                                   "text/csv", on_click="ignore")
+            with col_d2:
+                st.download_button("Descargar Parquet", lambda: parquet_export(data), "predicciones_2026.parquet",
+                                   "application/vnd.apache.parquet", on_click="ignore",
+                                   disabled=not parquet_available(), help="Requiere pyarrow")
+            with col_d3:
+                st.download_button("Descargar todo (ZIP)", bundle, "porra_2026.zip", "application/zip",
+                                   on_click="ignore", help="Predicciones, opiniones por persona y resultados en CSV")
+
+    with tab5:
+        st.subheader("⏱️ Rendimiento")
+        st.caption("Métricas de todo el proceso (todas las sesiones) desde el último reinicio; "
+                   f"percentiles sobre las últimas {WINDOW} llamadas de cada operación.")
+        import pandas as pd
+
+        runs, requests = metrics.calls("página."), metrics.calls("Sheets.")
+        col_r1, col_r2, col_r3 = st.columns(3)
+        col_r1.metric("Ejecuciones de página", runs)
+        col_r2.metric("Peticiones a Google Sheets", requests)
+        col_r3.metric("Peticiones por ejecución", f"{requests / runs:.2f}" if runs else "-")
+
+        timings = pd.DataFrame(metrics.timings())
+        if not timings.empty:
+            st.dataframe(timings, hide_index=True, column_config={
+                column: st.column_config.NumberColumn(format="%.1f")
+                for column in ("p50_ms", "p95_ms", "max_ms", "total_s")})
+        caches = pd.DataFrame(metrics.cache_rates())
+        if not caches.empty:
+            st.markdown("**Aciertos de caché**")
+            st.dataframe(caches, hide_index=True, column_config={
+                "tasa_acierto": st.column_config.ProgressColumn(format="percent", min_value=0, max_value=1)})
+
+        col_e1, col_e2 = st.columns(2)
+        with col_e1:
+            # El JSON (con todas las muestras) solo se genera al pulsar, no en cada rerun
+            st.download_button("📥 Exportar métricas (JSON)", metrics.export, "rendimiento.json", "application/json",
+                               on_click="ignore")
+        with col_e2:
+            if st.button("🧹 Reiniciar métricas"):
+                metrics.reset()
+                st.rerun()
 
 if __name__ == "__main__":
-    admin_page()
+    try:
+        admin_page()
+    finally:
+        profile.finish()
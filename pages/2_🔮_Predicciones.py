@@ -1,6 +1,10 @@
 import streamlit as st
-import pandas as pd
-from utils.database import GameDB
+from utils.profiling import startup_profile
+
+profile = startup_profile("Predicciones")
+
+from utils.database import StorageError, get_db
+from utils.groups import group_name, require_group
 import datetime
 import time
 
@@ -18,14 +22,32 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-def get_db():
-    return GameDB()
+def save_progress(db):
+    """Encola solo los campos que han cambiado desde el último guardado, más 'Timestamp'.
+
+    Las respuestas que siguen vacías y nunca se han guardado no cuentan como cambio
+    (en el paso 5 serían una opinión vacía por cada persona del grupo).
+    """
+    form_data = st.session_state.form_data
+    saved = st.session_state.saved_data
+    form_data["Timestamp"] = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    changes = {k: v for k, v in form_data.items()
+               if k not in ('Jugador', 'Timestamp') and saved.get(k, "") != v}
+    if changes:
+        db.queue_prediction({'Jugador': form_data['Jugador'], **changes, 'Timestamp': form_data["Timestamp"]})
+        saved.update(changes)
 
 def predictions_page():
     st.title("🔮 Tu Futuro en 2026")
+    profile.mark("primer pintado")
     
-    db = get_db()
-    players = db.get_players()
+    group = require_group()
+    db = get_db(group)
+    try:
+        players = db.get_players()
+    except StorageError as e:
+        st.error(f"No se pudo cargar la lista de jugadores: {e}")
+        return
     
     if not players:
         st.error("El administrador aún no ha añadido jugadores. Por favor, contacta con el administrador.")
@@ -36,19 +58,22 @@ def predictions_page():
         st.session_state.step = 0
     if 'form_data' not in st.session_state:
         st.session_state.form_data = {}
+    if 'saved_data' not in st.session_state:
+        st.session_state.saved_data = {}
 
     # Total de bloques lógicos (pantallas)
     total_steps = 5 # 2025, 2026 Personal, 2026 Mundo, Grupo, Individuales
     
     # 0. SELECCIÓN DE NOMBRE (Bloqueo inicial)
     if st.session_state.step == 0:
-        user_name = st.selectbox("🔍 Busca y selecciona tu nombre:", [""] + sorted(players), key="user_name_select")
-        
-        if user_name:
-            st.session_state.form_data['Jugador'] = user_name
-            if st.button("Comenzar ✨", use_container_width=True):
-                st.session_state.step = 1
-                st.rerun()
+        with st.form("paso_0", border=False, enter_to_submit=False):
+            user_name = st.selectbox("🔍 Busca y selecciona tu nombre:", [""] + sorted(players), key="user_name_select")
+            if st.form_submit_button("Comenzar ✨", use_container_width=True):
+                if user_name:
+                    st.session_state.form_data['Jugador'] = user_name
+                    st.session_state.step = 1
+                    st.rerun()
+                st.warning("Selecciona tu nombre para empezar.")
         return
 
     # Progreso visual
@@ -59,125 +84,140 @@ def predictions_page():
     # Lista de jugadores para las preguntas grupales
     all_players = sorted(players)
 
-    # --- PANTALLAS ---
+    # Cada paso es un formulario: lo que se escribe no provoca reruns ni lecturas hasta
+    # pulsar Anterior/Siguiente, que envían el paso entero de una vez (y lo guardan una vez)
+    with st.form(f"paso_{st.session_state.step}", border=False, enter_to_submit=False):
+        # --- PANTALLAS ---
     
-    # PASO 1: REFLEXIONES 2025
-    if st.session_state.step == 1:
-        st.header("📅 Despídete del 2025")
-        p_2025_word = st.text_input("Define tu 2025 en una sola palabra", value=st.session_state.form_data.get('Palabra 2025', ""))
-        p_2025_desc = st.text_area("¿Qué te ha parecido este año? Cuéntanos un poco", value=st.session_state.form_data.get('Descripcion 2025', ""))
-        momento_top = st.text_area("¿Cuál fue tu momento TOP?", value=st.session_state.form_data.get('Momento Top 2025', ""))
-        foto_top = st.file_uploader("Sube una foto de ese momento (opcional)", type=["jpg", "png", "jpeg"])
+        # PASO 1: REFLEXIONES 2025
+        if st.session_state.step == 1:
+            st.header("📅 Despídete del 2025")
+            p_2025_word = st.text_input("Define tu 2025 en una sola palabra", value=st.session_state.form_data.get('Palabra 2025', ""))
+            p_2025_desc = st.text_area("¿Qué te ha parecido este año? Cuéntanos un poco", value=st.session_state.form_data.get('Descripcion 2025', ""))
+            momento_top = st.text_area("¿Cuál fue tu momento TOP?", value=st.session_state.form_data.get('Momento Top 2025', ""))
+            foto_top = st.file_uploader("Sube una foto de ese momento (opcional)", type=["jpg", "png", "jpeg"])
         
-        if foto_top: st.session_state.form_data['Foto Momentos'] = "Subida ✅"
-        st.session_state.form_data.update({
-            "Palabra 2025": p_2025_word, 
-            "Descripcion 2025": p_2025_desc,
-            "Momento Top 2025": momento_top
-        })
-
-    # PASO 2: PREDICCIONES 2026 (PERSONAL)
-    elif st.session_state.step == 2:
-        st.header("🎯 Tu 2026")
-        p_2026_word = st.text_input("Define como sera tu 2026 en una sola palabra", value=st.session_state.form_data.get('Palabra 2026', ""))
-        expectativa = st.text_area("¿Cómo crees que te irá este año? ¿Qué esperas?", value=st.session_state.form_data.get('Expectativa 2026', ""))
-        st.session_state.form_data.update({
-            "Palabra 2026": p_2026_word, 
-            "Expectativa 2026": expectativa
-        })
-
-    # PASO 3: EL MUNDO EN 2026 (NUEVO)
-    elif st.session_state.step == 3:
-        st.header("🌍 La Porra Mundial")
-        st.write("¿Qué pasará en el mundo en 2026?")
+            if foto_top:
+                from utils.photos import store_photo
+
+                # A disco por su hash; en la sesión y en la predicción solo queda el hash
+                st.session_state.form_data['Foto Momentos'] = "Subida ✅"
+                st.session_state.form_data['Foto ID'] = store_photo(foto_top)
+            st.session_state.form_data.update({
+                "Palabra 2025": p_2025_word, 
+                "Descripcion 2025": p_2025_desc,
+                "Momento Top 2025": momento_top
+            })
+
+        # PASO 2: PREDICCIONES 2026 (PERSONAL)
+        elif st.session_state.step == 2:
+            st.header("🎯 Tu 2026")
+            p_2026_word = st.text_input("Define como sera tu 2026 en una sola palabra", value=st.session_state.form_data.get('Palabra 2026', ""))
+            expectativa = st.text_area("¿Cómo crees que te irá este año? ¿Qué esperas?", value=st.session_state.form_data.get('Expectativa 2026', ""))
+            st.session_state.form_data.update({
+                "Palabra 2026": p_2026_word, 
+                "Expectativa 2026": expectativa
+            })
+
+        # PASO 3: EL MUNDO EN 2026 (NUEVO)
+        elif st.session_state.step == 3:
+            st.header("🌍 La Porra Mundial")
+            st.write("¿Qué pasará en el mundo en 2026?")
         
-        def world_input(label, key, type="text"):
-            if type == "text":
-                val = st.text_input(label, value=st.session_state.form_data.get(key, ""))
-            elif type == "select":
-                options = ["", "Sí", "No", "Tal vez"]
-                current = st.session_state.form_data.get(key, "")
-                idx = options.index(current) if current in options else 0
-                val = st.selectbox(label, options, index=idx)
-            st.session_state.form_data[key] = val
-
-        st.subheader("🏆 Deportes")
-        world_input("Mundial 2026: ¿Quién ganará la final del mundial en NY?", "Ganador Mundial")
-        world_input("Champions League 2026: ¿Quién será el ganador de la Champions League?", "Ganador Champions")
-        world_input("La Liga 25/26: ¿Quién será el campeón de la La Liga?", "Ganador Liga")
+            def world_input(label, key, type="text"):
+                if type == "text":
+                    val = st.text_input(label, value=st.session_state.form_data.get(key, ""))
+                elif type == "select":
+                    options = ["", "Sí", "No", "Tal vez"]
+                    current = st.session_state.form_data.get(key, "")
+                    idx = options.index(current) if current in options else 0
+                    val = st.selectbox(label, options, index=idx)
+                st.session_state.form_data[key] = val
+
+            st.subheader("🏆 Deportes")
+            world_input("Mundial 2026: ¿Quién ganará la final del mundial en NY?", "Ganador Mundial")
+            world_input("Champions League 2026: ¿Quién será el ganador de la Champions League?", "Ganador Champions")
+            world_input("La Liga 25/26: ¿Quién será el campeón de la La Liga?", "Ganador Liga")
         
-        st.divider()
-        st.subheader("⚖️ Política y Actualidad")
-        world_input("¿Crees que habrá Elecciones Generales en España en 2026?", "Elecciones España", type="select")
-        world_input("Necroporra: ¿Qué famoso palma este año?", "Necroporra")
+            st.divider()
+            st.subheader("⚖️ Política y Actualidad")
+            world_input("¿Crees que habrá Elecciones Generales en España en 2026?", "Elecciones España", type="select")
+            world_input("Necroporra: ¿Qué famoso palma este año?", "Necroporra")
        
-    # PASO 4: SOBRE LOS DEMÁS (Permite autovoto)
-    elif st.session_state.step == 4:
-        st.header("👥 Predicciones de Grupo")
-        st.write("¿Quién crees que será el protagonista?")
+        # PASO 4: SOBRE LOS DEMÁS (Permite autovoto)
+        elif st.session_state.step == 4:
+            st.header("👥 Predicciones de Grupo")
+            st.write("¿Quién crees que será el protagonista?")
         
-        def group_vote(label, key):
-            current_val = st.session_state.form_data.get(key, "")
-            options = [""] + all_players
-            idx = options.index(current_val) if current_val in options else 0
-            val = st.selectbox(label, options, index=idx, key=f"step_{key}")
-            st.session_state.form_data[key] = val
-
-        group_vote("¿Quién dará la noticia más importante en 2026?", "Noticia Importante")
-        group_vote("¿Quién dará la noticia más inesperada?", "Noticia Inesperada")
-        group_vote("¿Quién empezará una relación sorpresa?", "Relacion Sorpresa")
-        group_vote("¿Quién tendrá la anécdota más surrealista?", "Anecdota Surrealista")
-        group_vote("¿Quién dirá la frase más mítica del año?", "Frase Mitica")
-        group_vote("¿Quién va a hacer el mayor cambio físico?", "Cambio Fisico")
-        group_vote("¿Quién se comprará un coche este año?", "Comprara Coche")
-
-    # PASO 5: ANÁLISIS PERSONALIZADO
-    elif st.session_state.step == 5:
-        st.header("🧪 Uno por Uno")
-        st.write(f"Dinos qué esperas de cada integrante de NPM para este 2026:")
+            def group_vote(label, key):
+                current_val = st.session_state.form_data.get(key, "")
+                options = [""] + all_players
+                idx = options.index(current_val) if current_val in options else 0
+                val = st.selectbox(label, options, index=idx, key=f"step_{key}")
+                st.session_state.form_data[key] = val
+
+            group_vote("¿Quién dará la noticia más importante en 2026?", "Noticia Importante")
+            group_vote("¿Quién dará la noticia más inesperada?", "Noticia Inesperada")
+            group_vote("¿Quién empezará una relación sorpresa?", "Relacion Sorpresa")
+            group_vote("¿Quién tendrá la anécdota más surrealista?", "Anecdota Surrealista")
+            group_vote("¿Quién dirá la frase más mítica del año?", "Frase Mitica")
+            group_vote("¿Quién va a hacer el mayor cambio físico?", "Cambio Fisico")
+            group_vote("¿Quién se comprará un coche este año?", "Comprara Coche")
+
+        # PASO 5: ANÁLISIS PERSONALIZADO
+        elif st.session_state.step == 5:
+            st.header("🧪 Uno por Uno")
+            st.write(f"Dinos qué esperas de cada integrante de {group_name(group)} para este 2026:")
         
-        current_user = st.session_state.form_data.get('Jugador')
-        for person in all_players:
-            if person != current_user:
-                p_text = st.text_area(f"¿Qué hará o cómo le irá a {person}?", 
-                                     value=st.session_state.form_data.get(f"Sobre {person}", ""), 
-                                     key=f"ind_{person}")
-                st.session_state.form_data[f"Sobre {person}"] = p_text
-
-    # --- NAVEGACIÓN ---
-    col_nav1, col_nav2 = st.columns(2)
+            current_user = st.session_state.form_data.get('Jugador')
+            for person in all_players:
+                if person != current_user:
+                    p_text = st.text_area(f"¿Qué hará o cómo le irá a {person}?", 
+                                         value=st.session_state.form_data.get(f"Sobre {person}", ""), 
+                                         key=f"ind_{person}")
+                    st.session_state.form_data[f"Sobre {person}"] = p_text
+
+        # --- NAVEGACIÓN ---
+        col_nav1, col_nav2 = st.columns(2)
     
-    with col_nav1:
-        if st.session_state.step > 1:
-            if st.button("⬅️ Anterior", use_container_width=True):
-                # Guardar progreso antes de volver
-                st.session_state.form_data["Timestamp"] = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                db.save_prediction(st.session_state.form_data)
-                st.session_state.step -= 1
-                st.rerun()
+        with col_nav1:
+            if st.session_state.step > 1:
+                if st.form_submit_button("⬅️ Anterior", use_container_width=True):
+                    # Guardar progreso antes de volver (en segundo plano)
+                    save_progress(db)
+                    st.session_state.step -= 1
+                    st.rerun()
     
-    with col_nav2:
-        if st.session_state.step < total_steps:
-            if st.button("Siguiente ➡️", use_container_width=True):
-                # Guardar progreso al avanzar
-                st.session_state.form_data["Timestamp"] = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                db.save_prediction(st.session_state.form_data)
-                st.session_state.step += 1
-                st.rerun()
-        else:
-            if st.button("✨ Finalizar y Enviar", use_container_width=True):
-                st.session_state.form_data["Timestamp"] = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                if 'Foto Momentos' not in st.session_state.form_data:
-                    st.session_state.form_data['Foto Momentos'] = "No subida"
+        with col_nav2:
+            if st.session_state.step < total_steps:
+                if st.form_submit_button("Siguiente ➡️", use_container_width=True):
+                    # Guardar progreso al avanzar (en segundo plano)
+                    save_progress(db)
+                    st.session_state.step += 1
+                    st.rerun()
+            else:
+                if st.form_submit_button("✨ Finalizar y Enviar", use_container_width=True):
+                    if 'Foto Momentos' not in st.session_state.form_data:
+                        st.session_state.form_data['Foto Momentos'] = "No subida"
                 
-                db.save_prediction(st.session_state.form_data)
-                st.success("¡Todo guardado con éxito! 🥂")
-                st.balloons()
-                # Reset para que otro pueda jugar
-                st.session_state.step = 0
-                st.session_state.form_data = {}
-                time.sleep(3)
-                st.rerun()
+                    # Aquí sí se espera a que todo esté escrito
+                    save_progress(db)
+                    try:
+                        db.flush_predictions(st.session_state.form_data['Jugador'])
+                    except Exception as e:
+                        st.error(f"No se pudo guardar, inténtalo de nuevo: {e}")
+                        return
+                    st.success("¡Todo guardado con éxito! 🥂")
+                    st.balloons()
+                    # Reset para que otro pueda jugar
+                    st.session_state.step = 0
+                    st.session_state.form_data = {}
+                    st.session_state.saved_data = {}
+                    time.sleep(3)
+                    st.rerun()
 
 if __name__ == "__main__":
-    predictions_page()
+    try:
+        predictions_page()
+    finally:
+        profile.finish()
@@ -1,4 +1,7 @@
 import streamlit as st
+from utils.profiling import startup_profile
+
+profile = startup_profile("Inicio")
 
 st.set_page_config(
     page_title="Predicciones 2026",
@@ -47,42 +50,37 @@ st.markdown("""
 
 def main():
     st.title("🔮 Predicciones 2026")
+    profile.mark("primer pintado")
     
-    # Lógica de la cuenta atrás
+    # Cuenta atrás: se envía una vez y avanza sola en el navegador
     from datetime import datetime
-    
-    target_date = datetime(2026, 1, 1, 0, 0, 0)
-    now = datetime.now()
-    
-    if target_date > now:
-        diff = target_date - now
-        days = diff.days
-        hours, remainder = divmod(diff.seconds, 3600)
-        minutes, seconds = divmod(remainder, 60)
-        
-        col_c1, col_c2, col_c3, col_c4 = st.columns(4)
-        col_c1.metric("Días", days)
-        col_c2.metric("Horas", hours)
-        col_c3.metric("Minutos", minutes)
-        col_c4.metric("Segundos", seconds)
-    else:
-        st.success("¡BIENVENIDO AL 2026! 🥂")
+    from utils.countdown import countdown
+
+    countdown(datetime(2026, 1, 1, 0, 0, 0), "¡BIENVENIDO AL 2026! 🥂")
 
     col1, col2, col3 = st.columns([1, 2, 1])
     
     with col2:
-        st.markdown("""
+        from html import escape
+        from utils.groups import group_name, require_group
+
+        group = require_group()
+        st.markdown(f"""
         <div class="prediction-card">
-            <h3>Bienvenido a la porra de NPM</h3>
+            <h3>Bienvenido a la porra de {escape(group_name(group))}</h3>
             <hr style="opacity: 0.1">
         </div>
         """, unsafe_allow_html=True)
         
         if st.button("🚀 COMENZAR MI VIAJE", use_container_width=True):
-            st.switch_page("pages/2_🔮_Predicciones.py")
+            # Se mantiene ?porra=... en la dirección
+            st.switch_page("pages/2_🔮_Predicciones.py", query_params=st.query_params.to_dict())
 
     st.markdown("---")
 
 
 if __name__ == "__main__":
-    main()
+    try:
+        main()
+    finally:
+        profile.finish()
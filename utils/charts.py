@@ -0,0 +1,45 @@
+import math
+
+import streamlit as st
+
+from utils.metrics import metrics, timed
+
+ROW_HEIGHT = 250
+
+
+def votes_key(snapshot, questions):
+    """Recuentos de las preguntas [(pregunta, color)] como tupla hashable, para cachear la figura"""
+    return tuple(
+        (question, color, tuple(map(str, tally.index)), tuple(int(n) for n in tally.values))
+        for question, color in questions
+        for tally in [snapshot.tally(question)]
+    )
+
+
+def render_votes(key):
+    """Una sola figura con una gráfica de barras por pregunta, en dos columnas"""
+    from plotly.subplots import make_subplots
+    import plotly.graph_objects as go
+
+    rows = math.ceil(len(key) / 2)
+    fig = make_subplots(rows=rows, cols=2, subplot_titles=[f"🎯 {question}" for question, *_ in key],
+                        vertical_spacing=0.3 / rows, horizontal_spacing=0.08)
+    for i, (question, color, answers, votes) in enumerate(key):
+        fig.add_trace(go.Bar(x=answers, y=votes, name=question, marker_color=color),
+                      row=i // 2 + 1, col=i % 2 + 1)
+    fig.update_layout(height=ROW_HEIGHT * rows, showlegend=False, margin=dict(t=30, b=0, l=0, r=0))
+    return fig
+
+
+@st.cache_resource(max_entries=4)
+def _cached_votes(key):
+    metrics.cache_miss("gráficos")
+    with timed("gráficos.render"):
+        return render_votes(key)
+
+
+def votes_figure(snapshot, questions):
+    """Figura de votos de la porra de grupo, que solo se rehace si cambian los recuentos"""
+    key = votes_key(snapshot, questions)
+    metrics.cache_lookup("gráficos")
+    return _cached_votes(key)
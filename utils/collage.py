@@ -0,0 +1,80 @@
+import io
+
+import numpy as np
+import streamlit as st
+from PIL import Image, ImageColor, ImageDraw, ImageOps
+
+from utils.insights import content_hash
+from utils.metrics import metrics, timed
+from utils.photos import has_thumbnail, thumbnail
+
+COLS = 4
+TILE_SIZE = 200
+BACKGROUND = '#1e1e2f'
+DEFAULT_COLOR = '#ff4b2b'
+DEFAULT_EMOJI = '✨'
+TILE_COLUMNS = ['Jugador', 'Mood Color', 'Mood Emoji', 'Foto ID']
+
+
+def collage_tiles(data):
+    """Lo único que pinta el collage: jugador, color, emoji (con sus valores por defecto) y foto.
+
+    'Foto ID' queda vacío mientras su miniatura no exista, así el collage cambia cuando aparece.
+    """
+    tiles = data.reindex(columns=TILE_COLUMNS)
+    tiles['Foto ID'] = [photo if has_thumbnail(photo) else "" for photo in tiles['Foto ID']]
+    return tiles.fillna({'Mood Color': DEFAULT_COLOR, 'Mood Emoji': DEFAULT_EMOJI, 'Jugador': ""})
+
+
+def _rgb(color):
+    try:
+        return ImageColor.getrgb(str(color))[:3]
+    except ValueError:
+        return ImageColor.getrgb(DEFAULT_COLOR)
+
+
+@timed("collage.render")
+def render_collage(tiles):
+    """PNG del collage: la rejilla de colores sale de un único array NumPy y el texto
+    se dibuja en una capa aparte que se compone encima"""
+    rows = max(1, (len(tiles) + COLS - 1) // COLS)
+
+    # Un color por casilla (las sobrantes con el fondo) y se escala cada casilla a TILE_SIZE
+    palette = {color: _rgb(color) for color in tiles['Mood Color'].unique()}
+    grid = np.empty((rows * COLS, 3), dtype=np.uint8)
+    grid[:] = _rgb(BACKGROUND)
+    grid[:len(tiles)] = [palette[color] for color in tiles['Mood Color']]
+    pixels = grid.reshape(rows, COLS, 3).repeat(TILE_SIZE, axis=0).repeat(TILE_SIZE, axis=1)
+    img = Image.fromarray(pixels, 'RGB').convert('RGBA')
+
+    # Las casillas con foto llevan su miniatura (nunca la foto original) recortada al tamaño
+    for i, photo in enumerate(tiles['Foto ID']):
+        data = thumbnail(photo)
+        if data:
+            r, c = divmod(i, COLS)
+            with Image.open(io.BytesIO(data)) as thumb:
+                img.paste(ImageOps.fit(thumb.convert('RGBA'), (TILE_SIZE, TILE_SIZE)), (c * TILE_SIZE, r * TILE_SIZE))
+
+    # Nombre y emoji (simplificado sin fuentes externas para evitar errores)
+    text = Image.new('RGBA', img.size, (0, 0, 0, 0))
+    draw = ImageDraw.Draw(text)
+    for i, (name, emoji) in enumerate(zip(tiles['Jugador'], tiles['Mood Emoji'])):
+        r, c = divmod(i, COLS)
+        draw.text((c * TILE_SIZE + 10, r * TILE_SIZE + 10), f"{emoji}\n{str(name)[:10]}", fill='white')
+
+    buf = io.BytesIO()
+    Image.alpha_composite(img, text).convert('RGB').save(buf, format='PNG')
+    return buf.getvalue()
+
+
+@st.cache_data(max_entries=4)
+def _cached_collage(digest, _tiles):
+    metrics.cache_miss("collage")
+    return render_collage(_tiles)
+
+
+def collage_png(data):
+    """PNG del collage del grupo, cacheado por (Jugador, Mood Color, Mood Emoji, Foto ID)"""
+    tiles = collage_tiles(data)
+    metrics.cache_lookup("collage")
+    return _cached_collage(content_hash(tiles), tiles)
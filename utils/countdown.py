@@ -0,0 +1,62 @@
+import json
+from datetime import datetime
+from string import Template
+
+import streamlit as st
+
+# La cuenta atrás avanza en el navegador: el servidor solo envía los milisegundos que
+# faltan al pintar la página (sin depender del reloj del visitante) y un script la
+# actualiza cada segundo, sin reruns ni carga en el servidor por cada persona conectada.
+_COUNTDOWN = Template("""
+<style>
+    .porra-countdown { display: grid; grid-template-columns: repeat(4, 1fr); gap: 1rem; }
+    .porra-countdown .label { font-size: 0.875rem; opacity: 0.7; }
+    .porra-countdown .value { font-size: 2.25rem; line-height: 1.4; }
+    .porra-countdown-done { padding: 1rem; border-radius: 0.5rem;
+                            background: rgba(33, 195, 84, 0.1); color: rgb(23, 114, 51); }
+</style>
+<div id="porra-countdown" class="porra-countdown">
+    <div><div class="label">Días</div><div class="value" data-unit="days">$days</div></div>
+    <div><div class="label">Horas</div><div class="value" data-unit="hours">$hours</div></div>
+    <div><div class="label">Minutos</div><div class="value" data-unit="minutes">$minutes</div></div>
+    <div><div class="label">Segundos</div><div class="value" data-unit="seconds">$seconds</div></div>
+</div>
+<script>
+(() => {
+    const target = Date.now() + $remaining_ms;
+    // En cada rerun de la página se vuelve a pintar: un solo temporizador a la vez
+    clearInterval(window.porraCountdown);
+    const tick = () => {
+        const box = document.getElementById("porra-countdown");
+        if (!box) return clearInterval(window.porraCountdown);
+        const left = Math.floor((target - Date.now()) / 1000);
+        if (left < 0) {
+            clearInterval(window.porraCountdown);
+            box.className = "porra-countdown-done";
+            box.textContent = $done;
+            return;
+        }
+        const units = {days: Math.floor(left / 86400), hours: Math.floor(left / 3600) % 24,
+                       minutes: Math.floor(left / 60) % 60, seconds: left % 60};
+        for (const [unit, value] of Object.entries(units)) {
+            box.querySelector(`[data-unit="$${unit}"]`).textContent = value;
+        }
+    };
+    window.porraCountdown = setInterval(tick, 1000);
+})();
+</script>
+""")
+
+
+def countdown(target, done_message):
+    """Cuenta atrás hasta `target` (hora del servidor) que se actualiza sola en el navegador"""
+    remaining = target - datetime.now()
+    if remaining.total_seconds() <= 0:
+        st.success(done_message)
+        return
+    hours, rest = divmod(remaining.seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    st.html(_COUNTDOWN.substitute(days=remaining.days, hours=hours, minutes=minutes, seconds=seconds,
+                                  remaining_ms=int(remaining.total_seconds() * 1000),
+                                  done=json.dumps(done_message)),
+            unsafe_allow_javascript=True)
@@ -1,64 +1,572 @@
+import random
+import sqlite3
+import sys
+import threading
+import time
+from abc import ABC, abstractmethod
+
 import streamlit as st
-import pandas as pd
-from streamlit_gsheets import GSheetsConnection
 
-class GameDB:
+from utils.groups import DEFAULT_GROUP, MAX_ACTIVE_GROUPS, GroupPool, current_group, group_settings
+from utils.metrics import metrics, timed
+from utils.opinions import OPINION_COLUMNS, from_wide, has_text, is_opinion_column, split_prediction, to_wide
+from utils.results import RESULT_COLUMNS
+from utils.writer import WriteBehindQueue
+
+
+class StorageError(Exception):
+    """Fallo del almacenamiento, con un mensaje que las páginas pueden mostrar"""
+
+
+class RateLimitError(StorageError):
+    """Se ha agotado la cuota de peticiones de Google Sheets"""
+
+
+class StorageUnavailableError(StorageError):
+    """Google Sheets sigue fallando (5xx) tras todos los reintentos"""
+
+
+class _Flight:
+    """Lectura en curso que comparten todas las sesiones que la piden a la vez"""
+
     def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class RequestScheduler:
+    """Planificador único de peticiones a la API de Google Sheets.
+
+    - Cubo de tokens: como mucho `per_minute` peticiones por minuto, con ráfagas de
+      hasta `burst`. Si no hay hueco en `max_wait` segundos lanza RateLimitError.
+    - Reintentos con backoff exponencial y jitter en respuestas 429 y 5xx.
+    - Las lecturas idénticas simultáneas (mismo `merge_key`) hacen una sola petición.
+    """
+
+    def __init__(self, per_minute=60, burst=10, retries=5, base_delay=1.0, max_delay=32.0, max_wait=30.0):
+        self.rate = per_minute / 60
+        self.burst = burst
+        self.retries = retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_wait = max_wait
+        self.lock = threading.Lock()
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.flights = {}
+
+    def call(self, fn, *args, merge_key=None, **kwargs):
+        """Ejecuta fn(*args, **kwargs) respetando la cuota y reintentando si procede"""
+        if merge_key is None:
+            return self._call_with_retries(fn, args, kwargs)
+
+        with self.lock:
+            flight = self.flights.get(merge_key)
+            leader = flight is None
+            if leader:
+                flight = self.flights[merge_key] = _Flight()
+        metrics.cache_lookup("Sheets.lecturas compartidas", hit=not leader)
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
         try:
-            self.conn = st.connection("gsheets", type=GSheetsConnection)
+            flight.result = self._call_with_retries(fn, args, kwargs)
+            return flight.result
         except Exception as e:
-            st.error(f"Error al conectar con Google Sheets: {e}")
-            self.conn = None
+            flight.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.flights[merge_key]
+            flight.done.set()
+
+    def _acquire(self):
+        deadline = time.monotonic() + self.max_wait
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            if now + wait > deadline:
+                raise RateLimitError("Demasiadas peticiones a Google Sheets, inténtalo en unos segundos")
+            time.sleep(wait)
+
+    def _call_with_retries(self, fn, args, kwargs):
+        from gspread.exceptions import APIError
+
+        name = f"Sheets.{getattr(fn, '__name__', 'petición')}"
+        for attempt in range(self.retries + 1):
+            self._acquire()
+            try:
+                with timed(name):
+                    return fn(*args, **kwargs)
+            except APIError as e:
+                status = e.response.status_code
+                if status != 429 and status < 500:
+                    raise
+                if attempt == self.retries:
+                    if status == 429:
+                        raise RateLimitError("Google Sheets ha limitado las peticiones (cuota agotada)") from e
+                    raise StorageUnavailableError(f"Google Sheets no responde (error {status})") from e
+                # Backoff exponencial con jitter completo
+                time.sleep(random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt)))
+
 
+class StorageBackend(ABC):
+    """Interfaz común de almacenamiento que usa GameDB"""
+
+    @abstractmethod
     def get_players(self):
-        """Obtiene la lista de jugadores desde la pestaña 'Players'"""
-        if self.conn is None: return []
+        """Devuelve la lista de nombres de jugadores"""
+
+    @abstractmethod
+    def save_player(self, name):
+        """Guarda un nuevo jugador si no existe"""
+
+    @abstractmethod
+    def save_prediction(self, data):
+        """Guarda o actualiza la predicción de data['Jugador']"""
+
+    def save_predictions(self, rows):
+        """Guarda varias predicciones de golpe (por defecto, una a una)"""
+        for data in rows:
+            self.save_prediction(data)
+
+    @abstractmethod
+    def save_opinions(self, rows):
+        """Guarda o actualiza opiniones (upsert por 'Autor' y 'Sujeto')"""
+
+    @abstractmethod
+    def save_results(self, rows):
+        """Guarda o actualiza resultados reales (upsert por 'Pregunta')"""
+
+    @abstractmethod
+    def get_results(self):
+        """Devuelve los resultados reales (Pregunta, Resultado, Alias, Puntos, Timestamp)"""
+
+    @abstractmethod
+    def get_all_predictions(self):
+        """Devuelve todas las predicciones como DataFrame"""
+
+    @abstractmethod
+    def get_opinions(self):
+        """Devuelve la tabla 'Opinions' (Autor, Sujeto, Texto, Timestamp)"""
+
+    @abstractmethod
+    def drop_prediction_columns(self, columns):
+        """Elimina columnas de 'Predictions' (usado al migrar al formato largo)"""
+
+    def close(self):
+        """Libera la conexión (se llama antes de reconectar)"""
+
+
+def _read_sql(query, conn):
+    import pandas as pd
+
+    return pd.read_sql_query(query, conn)
+
+
+def _quote(column):
+    """Escapa un nombre de columna para SQL ('Sobre X' -> '"Sobre X"')"""
+    return '"' + str(column).replace('"', '""') + '"'
+
+
+class SQLiteBackend(StorageBackend):
+    """Almacenamiento local en SQLite, sin red ni credenciales.
+
+    'players' y 'predictions' tienen clave primaria (índice único) por nombre y
+    'opinions' por (Autor, Sujeto), así que cada guardado es un upsert de una sola
+    fila. Las columnas de 'predictions' se crean bajo demanda, igual que las
+    cabeceras del Sheet.
+    """
+
+    def __init__(self, path="porra.db"):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.conn:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.execute('CREATE TABLE IF NOT EXISTS players ("Nombre" TEXT PRIMARY KEY)')
+            self.conn.execute('CREATE TABLE IF NOT EXISTS predictions ("Jugador" TEXT PRIMARY KEY)')
+            self.conn.execute('CREATE TABLE IF NOT EXISTS opinions ("Autor" TEXT NOT NULL, "Sujeto" TEXT NOT NULL, '
+                              '"Texto" TEXT, "Timestamp" TEXT, PRIMARY KEY ("Autor", "Sujeto"))')
+            self.conn.execute('CREATE INDEX IF NOT EXISTS opinions_sujeto ON opinions ("Sujeto")')
+            self.conn.execute('CREATE TABLE IF NOT EXISTS results ("Pregunta" TEXT PRIMARY KEY, "Resultado" TEXT, '
+                              '"Alias" TEXT, "Puntos" REAL, "Timestamp" TEXT)')
+            self.columns = [row[1] for row in self.conn.execute("PRAGMA table_info(predictions)")]
+
+    def _ensure_columns(self, keys):
+        """Añade a 'predictions' las columnas que aún no existen"""
+        for key in keys:
+            if key not in self.columns:
+                self.conn.execute(f"ALTER TABLE predictions ADD COLUMN {_quote(key)}")
+                self.columns.append(key)
+
+    def get_players(self):
+        with self.lock:
+            rows = self.conn.execute('SELECT "Nombre" FROM players ORDER BY rowid').fetchall()
+        return [row[0] for row in rows]
+
+    def save_player(self, name):
+        with self.lock, self.conn:
+            self.conn.execute('INSERT INTO players ("Nombre") VALUES (?) ON CONFLICT DO NOTHING', (name,))
+
+    def save_prediction(self, data):
+        self.save_predictions([data])
+
+    def save_predictions(self, rows):
+        # Todas las filas en una sola transacción
+        with self.lock, self.conn:
+            for data in rows:
+                keys = ['Jugador'] + [k for k in data if k != 'Jugador']
+                self._ensure_columns(keys)
+                self.conn.execute(self._upsert_sql(keys), [data.get(k) for k in keys])
+
+    @staticmethod
+    def _upsert_sql(keys):
+        columns = ", ".join(_quote(k) for k in keys)
+        placeholders = ", ".join("?" for _ in keys)
+        updates = ", ".join(f"{_quote(k)} = excluded.{_quote(k)}" for k in keys[1:])
+        on_conflict = f"DO UPDATE SET {updates}" if updates else "DO NOTHING"
+        return (f"INSERT INTO predictions ({columns}) VALUES ({placeholders}) "
+                f'ON CONFLICT("Jugador") {on_conflict}')
+
+    def save_opinions(self, rows):
+        with self.lock, self.conn:
+            self.conn.executemany(
+                'INSERT INTO opinions ("Autor", "Sujeto", "Texto", "Timestamp") VALUES (?, ?, ?, ?) '
+                'ON CONFLICT("Autor", "Sujeto") DO UPDATE SET "Texto" = excluded."Texto", '
+                '"Timestamp" = excluded."Timestamp"',
+                [[data.get(k) for k in OPINION_COLUMNS] for data in rows])
+
+    def save_results(self, rows):
+        with self.lock, self.conn:
+            self.conn.executemany(
+                'INSERT INTO results ("Pregunta", "Resultado", "Alias", "Puntos", "Timestamp") '
+                'VALUES (?, ?, ?, ?, ?) ON CONFLICT("Pregunta") DO UPDATE SET '
+                '"Resultado" = excluded."Resultado", "Alias" = excluded."Alias", '
+                '"Puntos" = excluded."Puntos", "Timestamp" = excluded."Timestamp"',
+                [[data.get(k) for k in RESULT_COLUMNS] for data in rows])
+
+    def get_all_predictions(self):
+        with self.lock:
+            return _read_sql("SELECT * FROM predictions ORDER BY rowid", self.conn)
+
+    def get_opinions(self):
+        with self.lock:
+            return _read_sql("SELECT * FROM opinions ORDER BY rowid", self.conn)
+
+    def get_results(self):
+        with self.lock:
+            return _read_sql("SELECT * FROM results ORDER BY rowid", self.conn)
+
+    def drop_prediction_columns(self, columns):
+        with self.lock, self.conn:
+            for column in columns:
+                if column in self.columns:
+                    self.conn.execute(f"ALTER TABLE predictions DROP COLUMN {_quote(column)}")
+                    self.columns.remove(column)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+def _is_connection_error(error):
+    """True si el error indica conexión caída o credenciales caducadas (merece reconectar)"""
+    if isinstance(error, sqlite3.ProgrammingError):
+        return True
+    if "gspread" not in sys.modules:
+        return False  # Sin Google Sheets en uso: no hace falta cargar gspread y compañía
+    from google.auth.exceptions import RefreshError, TransportError
+    from gspread.exceptions import APIError
+    from requests.exceptions import ConnectionError as RequestsConnectionError
+
+    if isinstance(error, (RefreshError, TransportError, RequestsConnectionError)):
+        return True
+    return isinstance(error, APIError) and error.response.status_code == 401
+
+
+_schedulers = {}
+_schedulers_lock = threading.Lock()
+
+
+def _scheduler(connection, per_minute):
+    """RequestScheduler de una conexión, compartido por todos los grupos que la usan.
+
+    La cuota de Google es de las credenciales, no de cada hoja: un solo cubo de tokens
+    por conexión, con el `requests_per_minute` más bajo de sus grupos.
+    """
+    with _schedulers_lock:
+        scheduler = _schedulers.get(connection)
+        if scheduler is None:
+            scheduler = _schedulers[connection] = RequestScheduler(per_minute=per_minute)
+        with scheduler.lock:
+            scheduler.rate = min(scheduler.rate, per_minute / 60)
+        return scheduler
+
+
+def create_backend(settings):
+    """Crea el backend indicado en [storage] de secrets.toml (por defecto Google Sheets)"""
+    backend = settings.get("backend", "gsheets")
+    if backend == "sqlite":
+        return SQLiteBackend(settings.get("path", "porra.db"))
+    if backend == "gsheets":
+        # gspread y compañía solo se importan si se usa Google Sheets
+        from utils.sheets import SheetsBackend
+
+        connection = settings.get("connection", "gsheets")
+        scheduler = _scheduler(connection, settings.get("requests_per_minute", 60))
+        return SheetsBackend(scheduler, connection=connection, prefix=settings.get("prefix", ""))
+    raise ValueError(f"Backend de almacenamiento desconocido: {backend}")
+
+
+class ReadCache:
+    """Caché de lecturas de un grupo, compartida por todas sus sesiones.
+
+    Cada entrada caduca a los `ttl` segundos o en cuanto se invalida su clave:
+    cada escritura sube la versión, así que quien escribe ve sus propios cambios.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = {}  # clave -> (versión, caduca_en, valor)
+        self.versions = {}
+
+    def get(self, key, loader, ttl):
+        if ttl <= 0:
+            metrics.cache_lookup(f"lectura.{key}", hit=False)
+            return loader()
+        with self.lock:
+            version = self.versions.get(key, 0)
+            entry = self.entries.get(key)
+            if entry and entry[0] == version and entry[1] > time.monotonic():
+                metrics.cache_lookup(f"lectura.{key}", hit=True)
+                return entry[2].copy()
+        metrics.cache_lookup(f"lectura.{key}", hit=False)
+        value = loader()
+        with self.lock:
+            # Si hubo una escritura durante la carga, el valor ya nace viejo: no se guarda
+            if self.versions.get(key, 0) == version:
+                self.entries[key] = (version, time.monotonic() + ttl, value)
+        return value.copy()
+
+    def invalidate(self, key):
+        with self.lock:
+            self.versions[key] = self.versions.get(key, 0) + 1
+            self.entries.pop(key, None)
+
+    def clear(self):
+        for key in list(self.entries):
+            self.invalidate(key)
+
+
+class GameDB:
+    """Acceso a los datos de un grupo, compartido por todas sus sesiones e hilos (ver get_db).
+
+    El backend se crea en el primer uso y se vuelve a crear si cambia el [storage]
+    del grupo en secrets.toml o si una operación falla por conexión o credenciales caducadas.
+    """
+
+    def __init__(self, group=DEFAULT_GROUP):
+        self.group = group
+        self.closed = False
+        self.cache = ReadCache()
+        self.cache_ttl = 0
+        self.lock = threading.Lock()
+        self._backend = None
+        self._settings = None
+        self.writer = WriteBehindQueue(self._write_batch)
+
+    @property
+    def backend(self):
+        """Backend actual, conectado bajo demanda (StorageUnavailableError si no se puede conectar)"""
         try:
-            df = self.conn.read(worksheet="Players")
-            return df['Nombre'].tolist() if not df.empty else []
-        except:
-            return []
+            settings = group_settings(self.group)["storage"]
+        except Exception as e:
+            raise StorageUnavailableError(f"No se pudo leer la configuración del almacenamiento: {e}") from e
+        with self.lock:
+            if self.closed:
+                # Cerrado por el pool (ver get_db): no se reabre por fuera de él
+                raise StorageUnavailableError("Esta porra se ha cerrado por inactividad, recarga la página")
+            if self._backend is None or settings != self._settings:
+                if self._backend is not None:
+                    self._backend.close()
+                    self._backend = None
+                    self.cache.clear()
+                try:
+                    self._backend = create_backend(settings)
+                except Exception as e:
+                    raise StorageUnavailableError(f"No se pudo conectar con el almacenamiento: {e}") from e
+                self._settings = settings
+                self.cache_ttl = settings.get("cache_ttl", 30)
+            return self._backend
+
+    def reconnect(self, backend):
+        """Descarta `backend` para que el siguiente acceso abra una conexión nueva"""
+        with self.lock:
+            if self._backend is backend:
+                self._backend = None
+        backend.close()
+
+    def close(self):
+        """Escribe los autoguardados pendientes y libera conexión y caché (lanza el error si no puede)"""
+        self.writer.close()
+        with self.lock:
+            self.closed = True
+            backend, self._backend, self._settings = self._backend, None, None
+        if backend is not None:
+            backend.close()
+        self.cache.clear()
 
+    def _cached(self, key, method):
+        """backend.method() a través de la caché de lecturas"""
+        self.backend  # conecta (y fija cache_ttl) o lanza StorageUnavailableError
+        return self.cache.get(key, lambda: self._call(method), self.cache_ttl)
+
+    def _call(self, method, *args):
+        """Ejecuta backend.method(*args), reconectando una vez si la conexión ha caducado.
+
+        Cualquier fallo llega a las páginas como StorageError (o una subclase).
+        """
+        backend = self.backend
+        try:
+            try:
+                with timed(f"almacenamiento.{method}"):
+                    return getattr(backend, method)(*args)
+            except Exception as e:
+                if not _is_connection_error(e):
+                    raise
+                self.reconnect(backend)
+                backend = self.backend
+                return getattr(backend, method)(*args)
+        except StorageError:
+            raise
+        except Exception as e:
+            raise StorageError(f"Error de almacenamiento: {e}") from e
+
+    @timed("GameDB.get_players")
+    def get_players(self):
+        """Obtiene la lista de jugadores desde la pestaña 'Players'"""
+        return self._cached("players", "get_players")
+
+    @timed("GameDB.save_player")
     def save_player(self, name):
         """Guarda un nuevo jugador"""
-        if self.conn is None: return
-        df = self.conn.read(worksheet="Players")
-        if name not in df['Nombre'].tolist():
-            new_row = pd.DataFrame([{"Nombre": name}])
-            df = pd.concat([df, new_row], ignore_index=True)
-            self.conn.update(worksheet="Players", data=df)
+        self._call("save_player", name)
+        self.cache.invalidate("players")
 
+    @timed("GameDB.save_prediction")
     def save_prediction(self, data):
         """Guarda o actualiza una predicción (Upsert basado en 'Jugador')"""
-        if self.conn is None: return
-        try:
-            df = self.conn.read(worksheet="Predictions")
-        except:
-            df = pd.DataFrame()
-        
-        if not df.empty and 'Jugador' in df.columns:
-            # Buscar si el jugador ya tiene una fila
-            jugador = data.get('Jugador')
-            if jugador in df['Jugador'].values:
-                # Actualizar la fila existente
-                idx = df[df['Jugador'] == jugador].index[0]
-                for key, value in data.items():
-                    df.at[idx, key] = value
-            else:
-                # Añadir nueva fila
-                new_row = pd.DataFrame([data])
-                df = pd.concat([df, new_row], ignore_index=True)
-        else:
-            # Primera fila
-            df = pd.DataFrame([data])
-            
-        self.conn.update(worksheet="Predictions", data=df)
+        self.save_predictions([data])
+
+    @timed("GameDB.save_predictions")
+    def save_predictions(self, rows):
+        """Guarda un lote de predicciones (una petición/transacción si el backend lo permite).
+
+        Las columnas 'Sobre X' se guardan aparte, una fila por opinión en 'Opinions'.
+        """
+        slim, opinions = [], []
+        for data in rows:
+            prediction, about = split_prediction(data)
+            slim.append(prediction)
+            opinions += about
+        self._call("save_predictions", slim)
+        self.cache.invalidate("predictions")
+        if opinions:
+            self._call("save_opinions", opinions)
+            self.cache.invalidate("opinions")
 
+    def _write_batch(self, rows):
+        # Si falla (p.ej. sin conexión), la cola reintenta el lote
+        self.save_predictions(rows)
+
+    @timed("GameDB.queue_prediction")
+    def queue_prediction(self, data):
+        """Autoguardado sin esperar a la red: se escribe en segundo plano"""
+        if self.closed:
+            raise StorageUnavailableError("Esta porra se ha cerrado por inactividad, recarga la página")
+        self.writer.submit(data)
+
+    @timed("GameDB.flush_predictions")
+    def flush_predictions(self, jugador=None):
+        """Fuerza la escritura de los autoguardados pendientes y espera a que termine"""
+        self.writer.flush(jugador)
+
+    @timed("GameDB.get_all_predictions")
     def get_all_predictions(self):
         """Obtiene todas las predicciones para el admin"""
-        if self.conn is None: return pd.DataFrame()
-        try:
-            return self.conn.read(worksheet="Predictions")
-        except:
-            return pd.DataFrame()
+        return self._cached("predictions", "get_all_predictions")
+
+    @timed("GameDB.get_opinions")
+    def get_opinions(self):
+        """Obtiene las opiniones en formato largo (Autor, Sujeto, Texto, Timestamp)"""
+        return self._cached("opinions", "get_opinions")
+
+    @timed("GameDB.get_results")
+    def get_results(self):
+        """Obtiene los resultados reales de las preguntas (pestaña/tabla 'Results')"""
+        return self._cached("results", "get_results")
+
+    @timed("GameDB.save_result")
+    def save_result(self, data):
+        """Guarda o corrige el resultado real de data['Pregunta']"""
+        self._call("save_results", [data])
+        self.cache.invalidate("results")
+
+    @timed("GameDB.get_wide_predictions")
+    def get_wide_predictions(self):
+        """Predicciones con una columna 'Sobre X' por persona, como la hoja original (para exportar)"""
+        return to_wide(self.get_all_predictions(), self.get_opinions())
+
+    @timed("GameDB.migrate_opinions")
+    def migrate_opinions(self):
+        """Pasa las columnas 'Sobre X' de 'Predictions' a la tabla 'Opinions'.
+
+        Las opiniones que ya estén en la tabla no se sobrescriben. Devuelve cuántas se han migrado.
+        """
+        import pandas as pd
+
+        # Los autoguardados en cola deben estar escritos antes de leer la hoja
+        self.writer.flush()
+        predictions = self._call("get_all_predictions")
+        legacy = [c for c in predictions.columns if is_opinion_column(c)]
+        if not legacy:
+            return 0
+        existing = self._call("get_opinions")
+        existing = existing[has_text(existing['Texto'])]
+        opinions = from_wide(predictions)
+        # Una fila vacía en la tabla no tapa el texto de la columna antigua (se sobrescribe)
+        known = pd.MultiIndex.from_frame(existing[['Autor', 'Sujeto']].astype(str))
+        opinions = opinions[~pd.MultiIndex.from_frame(opinions[['Autor', 'Sujeto']].astype(str)).isin(known)]
+        if not opinions.empty:
+            self._call("save_opinions", opinions.astype(object).where(opinions.notna(), None).to_dict('records'))
+        self._call("drop_prediction_columns", legacy)
+        self.cache.invalidate("predictions")
+        self.cache.invalidate("opinions")
+        return len(opinions)
+
+
+@st.cache_resource
+def _group_pool():
+    try:
+        max_groups = st.secrets.get("general", {}).get("max_active_groups", MAX_ACTIVE_GROUPS)
+    except Exception:
+        max_groups = MAX_ACTIVE_GROUPS
+    return GroupPool(GameDB, max_groups)
+
 
+def get_db(group=None):
+    """GameDB del grupo (por defecto el de la sesión): una conexión por grupo, reutilizada en
+    cada rerun y sesión. Por encima de [general] max_active_groups grupos abiertos, los que
+    llevan un rato sin usarse se cierran en segundo plano"""
+    return _group_pool().get(group or current_group() or DEFAULT_GROUP)
@@ -0,0 +1,129 @@
+import hashlib
+import importlib.util
+import io
+import os
+import tempfile
+import threading
+import zipfile
+from pathlib import Path
+
+from utils.insights import content_hash
+from utils.metrics import metrics, timed
+
+# Descargas de "📂 Datos Crudos". Se generan al pulsar el botón (no en cada render),
+# por trozos de CHUNK_ROWS filas directamente a un fichero temporal, y se reutilizan
+# mientras los datos no cambien: el nombre del fichero es la huella del contenido.
+EXPORT_DIR = Path(tempfile.gettempdir()) / "porra-exports"
+CHUNK_ROWS = 5000
+MAX_FILES = 12
+
+_lock = threading.Lock()
+
+
+def parquet_available():
+    """True si está instalado pyarrow (necesario para exportar a Parquet)"""
+    return importlib.util.find_spec("pyarrow") is not None
+
+
+def _chunks(data):
+    for start in range(0, max(len(data), 1), CHUNK_ROWS):
+        yield start, data.iloc[start:start + CHUNK_ROWS]
+
+
+def _write_csv(data, f):
+    for start, chunk in _chunks(data):
+        chunk.to_csv(f, header=start == 0, index=False)
+
+
+def _parquet_dtypes(data):
+    """Tipo de cada columna para el Parquet, decidido con la columna entera (no por trozo).
+
+    Tipos nullable de pandas: los enteros siguen siendo enteros y los booleanos
+    booleanos aunque falten valores; lo que sea una mezcla se guarda como texto.
+    """
+    dtypes = {}
+    for column in data.columns:
+        # Columna a columna: nunca hay una copia entera de la tabla en memoria
+        dtype = data[column].convert_dtypes(convert_integer=False).dtype
+        dtypes[column] = "string" if dtype == object else dtype
+    return dtypes
+
+
+def _write_parquet(data, path):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    # Esquema fijo para todos los trozos (un trozo con una columna vacía no puede cambiar su tipo)
+    dtypes = _parquet_dtypes(data)
+    names = [str(c) for c in data.columns]  # Parquet solo admite nombres de columna de texto
+
+    def table(chunk, schema=None):
+        return pa.Table.from_pandas(chunk.astype(dtypes).set_axis(names, axis=1), schema=schema,
+                                    preserve_index=False)
+
+    schema = table(data.iloc[:0]).schema
+    with pq.ParquetWriter(path, schema) as writer:
+        for _, chunk in _chunks(data):
+            writer.write_table(table(chunk, schema))
+
+
+def _write_bundle(frames, path):
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as bundle:
+        for name, data in frames.items():
+            with bundle.open(name, "w") as raw, io.TextIOWrapper(raw, encoding="utf-8", newline="") as f:
+                _write_csv(data, f)
+
+
+def _evict():
+    files = sorted(EXPORT_DIR.glob("*.export"), key=lambda p: p.stat().st_mtime)
+    for old in files[:-MAX_FILES]:
+        old.unlink(missing_ok=True)
+
+
+def _export(fmt, frames, write):
+    """Bytes del export `fmt` de `frames`, del fichero cacheado o generándolo ahora.
+
+    El fichero se genera por trozos, pero se devuelve entero: st.download_button guarda
+    en memoria lo que devuelve el callable (también si es un fichero abierto).
+    """
+    digest = hashlib.blake2b(fmt.encode(), digest_size=16)
+    for name, data in frames.items():
+        digest.update(name.encode())
+        digest.update(content_hash(data).encode())
+    path = EXPORT_DIR / f"{digest.hexdigest()}.{fmt}.export"
+
+    metrics.cache_lookup(f"export.{fmt}", hit=path.exists())
+    if not path.exists():
+        EXPORT_DIR.mkdir(parents=True, exist_ok=True)
+        # Se escribe aparte y se renombra: nadie descarga un fichero a medias
+        fd, tmp = tempfile.mkstemp(dir=EXPORT_DIR, suffix=".tmp")
+        os.close(fd)
+        try:
+            with timed(f"export.{fmt}"):
+                write(frames, tmp)
+            os.replace(tmp, path)
+        finally:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+        with _lock:
+            _evict()
+    os.utime(path)
+    return path.read_bytes()
+
+
+def csv_export(data):
+    """CSV de `data` (UTF-8, sin índice)"""
+    def write(frames, path):
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            _write_csv(frames["data"], f)
+    return _export("csv", {"data": data}, write)
+
+
+def parquet_export(data):
+    """Parquet de `data`, un row group por trozo"""
+    return _export("parquet", {"data": data}, lambda frames, path: _write_parquet(frames["data"], path))
+
+
+def bundle_export(frames):
+    """ZIP con un CSV por tabla, p.ej. {'predicciones.csv': ..., 'opiniones.csv': ...}"""
+    return _export("zip", frames, _write_bundle)
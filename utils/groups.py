@@ -0,0 +1,176 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import streamlit as st
+
+# Varias porras en un mismo despliegue. Cada grupo se declara en secrets.toml con su
+# nombre, su contraseña de admin y, si hace falta, su propio [storage]:
+#   [groups.npm]
+#   name = "NPM"
+#   admin_password = "..."
+#   [groups.npm.storage]
+#   backend = "sqlite"
+# y se entra con ?porra=npm. Sin sección [groups] hay un único grupo, DEFAULT_GROUP,
+# configurado como siempre con [general] y [storage].
+DEFAULT_GROUP = "default"
+DEFAULT_NAME = "NPM"
+GROUP_PARAM = "porra"
+MAX_ACTIVE_GROUPS = 8
+IDLE_SECONDS = 60  # un grupo usado hace menos puede tener una ejecución de página en curso
+
+
+def _secrets():
+    try:
+        return {key: st.secrets[key] for key in st.secrets}
+    except Exception:
+        return {}
+
+
+def group_ids():
+    """Identificadores de los grupos configurados"""
+    groups = _secrets().get("groups")
+    return [str(group) for group in groups] if groups else [DEFAULT_GROUP]
+
+
+def group_settings(group):
+    """Nombre, contraseña de admin y [storage] del grupo"""
+    secrets = _secrets()
+    general = dict(secrets.get("general", {}))
+    shared = dict(secrets.get("storage", {}))
+    password = general.get("admin_password", "2026")
+    if not secrets.get("groups"):
+        return {"name": DEFAULT_NAME, "admin_password": password, "storage": shared}
+
+    settings = dict(secrets["groups"].get(group, {}))
+    # [storage] sirve de valores por defecto, pero cada grupo tiene su espacio: su
+    # fichero SQLite, sus pestañas (npm_Predictions...) y su carpeta de fotos
+    storage = {**shared, "path": f"porra_{group}.db", "prefix": f"{group}_",
+               "photos_path": f"fotos/{group}", **dict(settings.get("storage", {}))}
+    return {
+        "name": settings.get("name", group),
+        "admin_password": settings.get("admin_password", password),
+        "storage": storage,
+    }
+
+
+def group_name(group):
+    return group_settings(group)["name"]
+
+
+def current_group():
+    """Grupo de esta sesión: el único configurado, el de ?porra=... o el elegido antes (None si falta)"""
+    ids = group_ids()
+    if len(ids) == 1:
+        return ids[0]
+    requested = st.query_params.get(GROUP_PARAM)
+    if requested in ids and requested != st.session_state.get("group"):
+        # Otra porra: no se arrastra nada de la anterior (jugador, pasos del asistente...)
+        for key in list(st.session_state):
+            del st.session_state[key]
+        st.session_state.group = requested
+    group = st.session_state.get("group")
+    return group if group in ids else None
+
+
+def require_group():
+    """Grupo actual; si no hay ninguno, pide el código de la porra y detiene la página"""
+    group = current_group()
+    if group is not None:
+        return group
+    with st.form("elegir_porra", border=False):
+        code = st.text_input("🔑 Código de tu porra", help="Viene en el enlace que te han pasado (…?porra=código)")
+        if st.form_submit_button("Entrar"):
+            code = re.sub(r"\s+", "", code).lower()
+            if code in group_ids():
+                st.query_params[GROUP_PARAM] = code
+                st.rerun()
+            st.error("No hay ninguna porra con ese código.")
+    st.stop()
+
+
+class GroupPool:
+    """Un objeto por grupo (su GameDB: conexión, cachés y cola de escritura), con LRU.
+
+    Si hay más de `max_groups` abiertos, un hilo de fondo cierra los usados hace más
+    tiempo, nunca en el hilo de una visita. Solo se cierran los que llevan `idle`
+    segundos sin usarse, para no cerrar uno que una sesión esté usando a mitad de
+    ejecución. Un grupo que no se puede cerrar (autoguardados que no se han podido
+    escribir) sigue abierto y se reintenta más tarde, en vez de perder los datos.
+    """
+
+    def __init__(self, factory, max_groups=MAX_ACTIVE_GROUPS, idle=IDLE_SECONDS):
+        self.factory = factory
+        self.max_groups = max_groups
+        self.idle = idle
+        self.cond = threading.Condition()
+        self.items = OrderedDict()
+        self.used = {}     # grupo -> último get()
+        self.closing = {}  # grupos que se están cerrando ahora mismo
+        self.thread = None
+
+    def get(self, group):
+        with self.cond:
+            # No se abre otro mientras se cierra: dos GameDB del mismo grupo desordenarían escrituras
+            self.cond.wait_for(lambda: group not in self.closing)
+            item = self.items.get(group)
+            if item is None:
+                item = self.items[group] = self.factory(group)
+            self.items.move_to_end(group)
+            self.used[group] = time.monotonic()
+            if len(self.items) > self.max_groups:
+                if self.thread is None:
+                    self.thread = threading.Thread(target=self._run, name="porra-groups", daemon=True)
+                    self.thread.start()
+                self.cond.notify_all()
+        return item
+
+    def _take_idle(self):
+        """Saca del pool los que sobran y llevan `idle` segundos sin usarse (con el lock tomado)"""
+        now = time.monotonic()
+        excess = len(self.items) - self.max_groups
+        victims = []
+        for group in list(self.items):  # de menos a más reciente
+            if len(victims) >= excess:
+                break
+            if now - self.used[group] >= self.idle:
+                victims.append((group, self.items.pop(group)))
+                self.closing[group] = victims[-1][1]
+        return victims
+
+    def _close(self, group, item):
+        try:
+            item.close()
+            closed = True
+        except Exception:
+            closed = False
+        with self.cond:
+            del self.closing[group]
+            if closed:
+                self.used.pop(group, None)
+            else:
+                self.items[group] = item
+                self.items.move_to_end(group, last=False)
+            self.cond.notify_all()
+
+    def _run(self):
+        while True:
+            with self.cond:
+                self.cond.wait_for(lambda: len(self.items) > self.max_groups)
+                victims = self._take_idle()
+            for group, item in victims:
+                self._close(group, item)
+            with self.cond:
+                if len(self.items) > self.max_groups:
+                    # Los que sobran están en uso o no se pudieron cerrar: se reintenta más tarde
+                    self.cond.wait(self.idle)
+
+    def clear(self):
+        """Cierra ya todos los grupos (los que no se puedan cerrar siguen abiertos)"""
+        with self.cond:
+            victims = list(self.items.items())
+            self.items.clear()
+            self.closing.update(victims)
+        for group, item in victims:
+            self._close(group, item)
@@ -0,0 +1,103 @@
+import hashlib
+
+import streamlit as st
+import pandas as pd
+
+from utils.metrics import metrics, timed
+from utils.opinions import OPINION_COLUMNS, merge_opinions
+
+# Preguntas de la porra mundial (paso 3) y de grupo (paso 4)
+WORLD_COLUMNS = ['Ganador Mundial', 'Ganador Champions', 'Ganador Liga', 'Ganador SuperBowl',
+                 'Elecciones España', 'Necroporra', 'Mision Artemis', 'Avengers Hit', 'Bombazo Famosos']
+GROUP_COLUMNS = ['Noticia Importante', 'Noticia Inesperada', 'Relacion Sorpresa', 'Anecdota Surrealista',
+                 'Frase Mitica', 'Cambio Fisico', 'Comprara Coche']
+
+
+def content_hash(data):
+    """Huella del contenido de un DataFrame (columnas y valores), vectorizada"""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update("\x1f".join(map(str, data.columns)).encode())
+    digest.update(pd.util.hash_pandas_object(data.astype(str), index=False).values.tobytes())
+    return digest.hexdigest()
+
+
+class InsightsSnapshot:
+    """Todos los recuentos de la pestaña Insights, calculados en una sola pasada.
+
+    Las respuestas de todas las preguntas se apilan en formato largo y se cuentan
+    con un único groupby, en vez de un value_counts() por pregunta. Las palabras
+    del 2026 se guardan ya contadas para la nube de palabras.
+    """
+
+    def __init__(self, data, opinions=None):
+        questions = [c for c in WORLD_COLUMNS + GROUP_COLUMNS if c in data.columns]
+        answers = data[questions].melt(var_name='Pregunta', value_name='Respuesta').dropna()
+        answers = answers[answers['Respuesta'].astype(str) != ""]
+        counts = (answers.groupby(['Pregunta', 'Respuesta'], sort=False).size()
+                  .sort_values(ascending=False, kind='stable'))
+
+        self.columns = set(data.columns)
+        self.players = data['Jugador'].tolist() if 'Jugador' in data.columns else []
+        self.tallies = {question: pd.Series(dtype=int) for question in questions}
+        for question, tally in counts.groupby(level='Pregunta', sort=False):
+            self.tallies[question] = tally.droplevel('Pregunta')
+
+        if 'Jugador' in data.columns:
+            self.by_player = data.drop_duplicates('Jugador').set_index('Jugador')
+        else:
+            self.by_player = pd.DataFrame()
+
+        # Opiniones en formato largo (tabla 'Opinions' y columnas 'Sobre X' sin migrar),
+        # indexadas por (Sujeto, Autor)
+        if opinions is None:
+            opinions = pd.DataFrame(columns=OPINION_COLUMNS)
+        opinions = merge_opinions(data, opinions)
+        written = (opinions['Texto'].notna()
+                   & ~opinions['Texto'].astype(str).isin(["", "Saltado"])
+                   & (opinions['Autor'] != opinions['Sujeto']))
+        self.opinions = opinions[written].set_index(['Sujeto', 'Autor'])['Texto']
+        self._opinions_by_subject = {
+            subject: group.droplevel('Sujeto')
+            for subject, group in self.opinions.groupby(level='Sujeto', sort=False)
+        }
+
+        # Frecuencias normalizadas (minúsculas, sin 'Saltado') de las palabras del 2026
+        palabras = data['Palabra 2026'] if 'Palabra 2026' in data.columns else pd.Series(dtype=str)
+        words = palabras.dropna().astype(str).str.lower().str.findall(r"\w+").explode().dropna()
+        counts = words[words != "saltado"].value_counts()
+        self.word_frequencies = {word: int(n) for word, n in counts.items()}
+
+    def tally(self, question):
+        """Votos por respuesta, de más a menos votada (vacío si nadie ha respondido)"""
+        return self.tallies.get(question, pd.Series(dtype=int))
+
+    def player_row(self, name):
+        """Fila de respuestas de un jugador (búsqueda por índice, sin recorrer los datos)"""
+        return self.by_player.loc[name]
+
+    def opinions_about(self, subject):
+        """Lo que ha escrito cada autor sobre `subject` (Serie autor -> texto)"""
+        return self._opinions_by_subject.get(subject, pd.Series(dtype=object))
+
+    def top_vote(self, question):
+        """Respuesta más votada y su número de votos, o ("N/A", 0)"""
+        tally = self.tally(question)
+        if tally.empty:
+            return "N/A", 0
+        return tally.index[0], tally.iloc[0]
+
+
+@st.cache_resource(max_entries=8)
+def _cached_snapshot(digest, _data, _opinions):
+    metrics.cache_miss("insights")
+    with timed("insights.snapshot"):
+        return InsightsSnapshot(_data, _opinions)
+
+
+def insights_snapshot(data, opinions=None):
+    """InsightsSnapshot memoizado por contenido: se recalcula solo si cambian los datos"""
+    digest = content_hash(data)
+    if opinions is not None:
+        digest += content_hash(opinions)
+    metrics.cache_lookup("insights")
+    return _cached_snapshot(digest, data, opinions)
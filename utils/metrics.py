@@ -0,0 +1,109 @@
+import json
+import threading
+import time
+from collections import deque
+from contextlib import ContextDecorator
+
+# Métricas del proceso (compartidas por todas las sesiones), que se ven en la pestaña
+# "⏱️ Rendimiento" del admin. De cada operación se guardan las últimas WINDOW
+# duraciones para calcular percentiles, más el total de llamadas y de errores.
+WINDOW = 500
+
+
+class _Series:
+    def __init__(self):
+        self.samples = deque(maxlen=WINDOW)
+        self.calls = 0
+        self.errors = 0
+        self.total = 0.0
+
+
+def _percentile(ordered, q):
+    return ordered[min(len(ordered) - 1, round(q * (len(ordered) - 1)))]
+
+
+class Metrics:
+    """Histograma móvil de latencias por operación y aciertos de cada caché"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.series = {}
+        self.caches = {}  # nombre -> [consultas, fallos]
+        self.started = time.time()
+
+    def observe(self, name, seconds, error=False):
+        with self.lock:
+            series = self.series.get(name) or self.series.setdefault(name, _Series())
+            series.samples.append(seconds)
+            series.calls += 1
+            series.errors += error
+            series.total += seconds
+
+    def cache_lookup(self, name, hit=None):
+        """Cuenta una consulta a la caché `name`; con hit=False cuenta también el fallo"""
+        with self.lock:
+            counts = self.caches.setdefault(name, [0, 0])
+            counts[0] += 1
+            counts[1] += hit is False
+
+    def cache_miss(self, name):
+        """Fallo de una caché cuya consulta ya se contó (p.ej. dentro de una función st.cache_*)"""
+        with self.lock:
+            self.caches.setdefault(name, [0, 0])[1] += 1
+
+    def timings(self):
+        """Una fila por operación: llamadas, errores y p50/p95/máx de la ventana en ms"""
+        with self.lock:
+            items = [(name, s.calls, s.errors, s.total, sorted(s.samples)) for name, s in self.series.items()]
+        return [{
+            "operación": name, "llamadas": calls, "errores": errors,
+            "p50_ms": _percentile(ordered, 0.5) * 1000, "p95_ms": _percentile(ordered, 0.95) * 1000,
+            "max_ms": ordered[-1] * 1000, "total_s": total,
+        } for name, calls, errors, total, ordered in sorted(items) if ordered]
+
+    def cache_rates(self):
+        """Una fila por caché: consultas, aciertos y tasa de acierto"""
+        with self.lock:
+            items = sorted((name, *counts) for name, counts in self.caches.items())
+        return [{"caché": name, "consultas": lookups, "aciertos": max(lookups - misses, 0),
+                 "tasa_acierto": max(lookups - misses, 0) / lookups if lookups else None}
+                for name, lookups, misses in items]
+
+    def calls(self, prefix):
+        """Total de llamadas de las operaciones que empiezan por `prefix`"""
+        with self.lock:
+            return sum(s.calls for name, s in self.series.items() if name.startswith(prefix))
+
+    def export(self):
+        """JSON con los resúmenes y las muestras de la ventana (en segundos)"""
+        with self.lock:
+            samples = {name: list(s.samples) for name, s in self.series.items()}
+        return json.dumps({"desde": self.started, "exportado": time.time(), "operaciones": self.timings(),
+                           "cachés": self.cache_rates(), "muestras": samples}, ensure_ascii=False, indent=2)
+
+    def reset(self):
+        with self.lock:
+            self.series.clear()
+            self.caches.clear()
+            self.started = time.time()
+
+
+metrics = Metrics()
+
+
+class timed(ContextDecorator):
+    """Mide un bloque (`with timed("admin.collage"):`) o una función (`@timed("GameDB.get_players")`)"""
+
+    def __init__(self, name):
+        self.name = name
+        self.local = threading.local()
+
+    def __enter__(self):
+        # Pila por hilo: el mismo decorador puede estar activo en varios hilos o anidado
+        stack = self.local.__dict__.setdefault("starts", [])
+        stack.append(time.perf_counter())
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        metrics.observe(self.name, time.perf_counter() - self.local.starts.pop(), error=exc_type is not None)
+        return False
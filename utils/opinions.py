@@ -0,0 +1,71 @@
+# Las respuestas del paso 5 ("¿Qué hará o cómo le irá a X?") se guardan normalizadas
+# en la tabla 'Opinions', una fila por (Autor, Sujeto), en vez de una columna
+# 'Sobre X' por persona en 'Predictions'.
+OPINION_PREFIX = "Sobre "
+OPINION_COLUMNS = ['Autor', 'Sujeto', 'Texto', 'Timestamp']
+
+
+def is_opinion_column(column):
+    """True para las columnas 'Sobre X' del formato ancho"""
+    return str(column).startswith(OPINION_PREFIX)
+
+
+def split_prediction(data):
+    """Separa un guardado del asistente en campos de 'Predictions' y filas de 'Opinions'"""
+    slim = {key: value for key, value in data.items() if not is_opinion_column(key)}
+    opinions = [
+        {'Autor': data.get('Jugador'), 'Sujeto': key[len(OPINION_PREFIX):],
+         'Texto': value, 'Timestamp': data.get('Timestamp')}
+        for key, value in data.items() if is_opinion_column(key)
+    ]
+    return slim, opinions
+
+
+def from_wide(predictions):
+    """Opiniones en formato largo a partir de las columnas 'Sobre X' de una hoja ancha"""
+    import pandas as pd
+
+    about = [c for c in predictions.columns if is_opinion_column(c)]
+    if not about or 'Jugador' not in predictions.columns:
+        return pd.DataFrame(columns=OPINION_COLUMNS)
+    id_vars = ['Jugador'] + (['Timestamp'] if 'Timestamp' in predictions.columns else [])
+    opinions = (predictions[id_vars + about]
+                .melt(id_vars=id_vars, var_name='Sujeto', value_name='Texto')
+                .rename(columns={'Jugador': 'Autor'}))
+    opinions['Sujeto'] = opinions['Sujeto'].str.slice(len(OPINION_PREFIX))
+    opinions = opinions[opinions['Texto'].notna() & (opinions['Texto'].astype(str) != "")]
+    return opinions.reindex(columns=OPINION_COLUMNS).reset_index(drop=True)
+
+
+def has_text(texts):
+    """Máscara de los textos no vacíos (ni NaN ni solo espacios)"""
+    return texts.notna() & (texts.astype(str).str.strip() != "")
+
+
+def merge_opinions(predictions, opinions):
+    """Opiniones de 'Opinions' más las que sigan en columnas 'Sobre X' sin migrar.
+
+    Manda la tabla, salvo que su fila esté vacía y la columna antigua tenga texto.
+    """
+    import pandas as pd
+
+    frames = [frame for frame in (opinions.reindex(columns=OPINION_COLUMNS), from_wide(predictions))
+              if not frame.empty]
+    if not frames:
+        return pd.DataFrame(columns=OPINION_COLUMNS)
+    combined = pd.concat(frames, ignore_index=True)
+    # Orden estable: primero las que tienen texto, y dentro de ellas la tabla antes que las columnas
+    combined = combined.sort_values('Texto', key=lambda texts: ~has_text(texts), kind='stable')
+    return (combined.drop_duplicates(['Autor', 'Sujeto'], keep='first')
+            .sort_index().reset_index(drop=True))
+
+
+def to_wide(predictions, opinions):
+    """Vista ancha clásica (una columna 'Sobre X' por persona), p.ej. para exportar a CSV"""
+    slim = predictions[[c for c in predictions.columns if not is_opinion_column(c)]]
+    merged = merge_opinions(predictions, opinions)
+    if merged.empty or 'Jugador' not in slim.columns:
+        return slim.copy()
+    wide = merged.pivot(index='Autor', columns='Sujeto', values='Texto')
+    wide.columns = [OPINION_PREFIX + str(subject) for subject in wide.columns]
+    return slim.merge(wide, left_on='Jugador', right_index=True, how='left')
@@ -0,0 +1,151 @@
+import hashlib
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+
+from utils.metrics import metrics
+
+# Fotos del "momento TOP" (paso 1). Se guardan en disco por su hash SHA-256, así que la
+# misma foto subida dos veces se guarda una vez, y en la predicción solo va el hash
+# ('Foto ID'). Un pool de procesos quita los metadatos EXIF (GPS incluido), reduce la
+# foto a DISPLAY_SIZE y genera la miniatura; después se borra el fichero original.
+#   <carpeta>/incoming/<hash>  subida original, pendiente de procesar
+#   <carpeta>/<hash>.jpg       foto sin EXIF, como mucho DISPLAY_SIZE px de lado
+#   <carpeta>/thumbs/<hash>.jpg miniatura de THUMB_SIZE px
+DISPLAY_SIZE = 1600
+THUMB_SIZE = 256
+MAX_THUMBS = 128  # miniaturas en memoria (unos 15 KB cada una)
+CHUNK_SIZE = 1 << 20
+
+_lock = threading.Lock()
+_pool = None
+_pending = {}  # hash -> Future del procesado en curso
+_thumbs = OrderedDict()  # hash -> bytes de la miniatura
+
+
+def photo_dir():
+    """Carpeta de fotos del grupo actual: `photos_path` de su [storage] o 'fotos'"""
+    try:
+        from utils.groups import current_group, group_settings
+        path = group_settings(current_group())["storage"].get("photos_path", "fotos")
+    except Exception:
+        path = "fotos"
+    return Path(path)
+
+
+def _save_jpeg(image, path):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    image.save(tmp, format="JPEG", quality=85)  # sin exif=...: no se copia ningún metadato
+    os.replace(tmp, path)
+
+
+def _process_photo(source, display, thumb):
+    """En un proceso del pool: foto sin EXIF y reducida, más su miniatura"""
+    from PIL import Image, ImageOps
+
+    with Image.open(source) as img:
+        # Se aplica la orientación del EXIF antes de descartarlo
+        img = ImageOps.exif_transpose(img).convert("RGB")
+    img.thumbnail((DISPLAY_SIZE, DISPLAY_SIZE))
+    _save_jpeg(img, display)
+    img.thumbnail((THUMB_SIZE, THUMB_SIZE))
+    _save_jpeg(img, thumb)
+    os.unlink(source)
+
+
+def _executor():
+    global _pool
+    with _lock:
+        if _pool is None:
+            # spawn: hacer fork de un proceso con hilos (Streamlit) no es seguro
+            _pool = ProcessPoolExecutor(max_workers=2, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def _submit(source, digest):
+    global _pool
+    root = photo_dir()
+    args = (source, root / f"{digest}.jpg", root / "thumbs" / f"{digest}.jpg")
+    start = time.perf_counter()
+    try:
+        future = _executor().submit(_process_photo, *args)
+    except BrokenProcessPool:
+        # Un proceso murió (p.ej. sin memoria): se crea un pool nuevo
+        with _lock:
+            _pool = None
+        future = _executor().submit(_process_photo, *args)
+
+    def done(future):
+        with _lock:
+            _pending.pop(digest, None)
+        metrics.observe("fotos.procesado", time.perf_counter() - start, error=future.exception() is not None)
+
+    with _lock:
+        _pending[digest] = future
+    future.add_done_callback(done)
+    return future
+
+
+def store_photo(upload):
+    """Guarda una subida (UploadedFile o similar) por su hash y lanza su procesado; devuelve el hash"""
+    root = photo_dir()
+    incoming = root / "incoming"
+    incoming.mkdir(parents=True, exist_ok=True)
+    sha = hashlib.sha256()
+    fd, tmp = tempfile.mkstemp(dir=incoming, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            upload.seek(0)
+            for chunk in iter(lambda: upload.read(CHUNK_SIZE), b""):
+                sha.update(chunk)
+                f.write(chunk)
+        digest = sha.hexdigest()
+        source = incoming / digest
+        with _lock:
+            pending = digest in _pending
+        if pending or (root / f"{digest}.jpg").exists():
+            metrics.cache_lookup("fotos", hit=True)
+            return digest
+        metrics.cache_lookup("fotos", hit=False)
+        # Si quedó una copia sin procesar (p.ej. tras un reinicio), se sustituye y se procesa
+        os.replace(tmp, source)
+    finally:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+    _submit(source, digest)
+    return digest
+
+
+def thumbnail(digest):
+    """Bytes JPEG de la miniatura (de una caché de MAX_THUMBS), o None si aún no existe"""
+    if not digest or digest != digest:
+        return None
+    digest = str(digest)
+    with _lock:
+        if digest in _thumbs:
+            _thumbs.move_to_end(digest)
+            metrics.cache_lookup("miniaturas", hit=True)
+            return _thumbs[digest]
+    try:
+        data = (photo_dir() / "thumbs" / f"{Path(digest).name}.jpg").read_bytes()
+    except OSError:
+        return None
+    metrics.cache_lookup("miniaturas", hit=False)
+    with _lock:
+        _thumbs[digest] = data
+        if len(_thumbs) > MAX_THUMBS:
+            _thumbs.popitem(last=False)
+    return data
+
+
+def has_thumbnail(digest):
+    """True si la miniatura ya está en disco (el procesado puede tardar unos segundos)"""
+    return bool(digest) and digest == digest and (photo_dir() / "thumbs" / f"{Path(str(digest)).name}.jpg").exists()
+
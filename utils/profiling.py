@@ -0,0 +1,100 @@
+import builtins
+import json
+import os
+import sys
+import threading
+import time
+
+from utils.metrics import metrics
+
+# Informe de arranque por página, activado con PORRA_PROFILE=1:
+#   PORRA_PROFILE=1 streamlit run streamlit_app.py
+# Cada ejecución de una página escribe en stderr el tiempo hasta el primer pintado,
+# el total y un desglose de imports al estilo de `python -X importtime`. Con
+# PORRA_PROFILE_FILE=ruta.jsonl se añade además una línea JSON por ejecución.
+ENABLED = os.environ.get("PORRA_PROFILE") == "1"
+
+_local = threading.local()
+# Si el módulo se recarga, se envuelve el import original y no el envoltorio anterior
+_original_import = getattr(builtins.__import__, "__wrapped__", builtins.__import__)
+
+
+def _timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+    profile = getattr(_local, "profile", None)
+    if profile is None or (level == 0 and name in sys.modules):
+        return _original_import(name, globals, locals, fromlist, level)
+
+    # Pila de tiempos de los imports anidados: self = acumulado - hijos
+    stack = profile.stack
+    stack.append(0.0)
+    start = time.perf_counter()
+    try:
+        return _original_import(name, globals, locals, fromlist, level)
+    finally:
+        cumulative = time.perf_counter() - start
+        children = stack.pop()
+        if stack:
+            stack[-1] += cumulative
+        profile.imports.append((len(stack), name, cumulative - children, cumulative))
+
+
+class StartupProfile:
+    """Cronómetro de una ejecución de página (no hace nada si el perfilado está desactivado)"""
+
+    def __init__(self, page):
+        self.page = page
+        self.start = time.perf_counter()
+        self.marks = []
+        self.imports = []  # (profundidad, módulo, self, acumulado) en orden de finalización
+        self.stack = []
+        if ENABLED:
+            _local.profile = self
+
+    def mark(self, label):
+        """Apunta un hito (p.ej. 'primer pintado') con el tiempo desde el inicio"""
+        if ENABLED:
+            self.marks.append((label, time.perf_counter() - self.start))
+
+    def finish(self):
+        """Cierra la medición y escribe el informe"""
+        total = time.perf_counter() - self.start
+        # La duración de cada ejecución va siempre a las métricas del admin
+        metrics.observe(f"página.{self.page}", total)
+        if not ENABLED or getattr(_local, "profile", None) is not self:
+            return
+        _local.profile = None
+        imported = sum(cumulative for depth, _, _, cumulative in self.imports if depth == 0)
+
+        lines = [f"[porra] {self.page}: " + ", ".join(
+            [f"{label} {seconds * 1000:.0f} ms" for label, seconds in self.marks]
+            + [f"total {total * 1000:.0f} ms", f"imports {imported * 1000:.0f} ms"])]
+        if self.imports:
+            lines.append("import time: self [us] | cumulative | imported package")
+            lines += [f"import time: {own * 1e6:>9.0f} | {cumulative * 1e6:>10.0f} | {'  ' * depth}{name}"
+                      for depth, name, own, cumulative in self.imports]
+        print("\n".join(lines), file=sys.stderr)
+
+        path = os.environ.get("PORRA_PROFILE_FILE")
+        if path:
+            record = {
+                "page": self.page,
+                "timestamp": time.time(),
+                "total_ms": total * 1000,
+                "imports_ms": imported * 1000,
+                "marks_ms": {label: seconds * 1000 for label, seconds in self.marks},
+                "imports": [{"module": name, "depth": depth, "self_us": own * 1e6, "cumulative_us": cumulative * 1e6}
+                            for depth, name, own, cumulative in self.imports],
+            }
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record) + "\n")
+
+
+def startup_profile(page):
+    """Empieza a medir la ejecución actual de `page`; hay que llamar a .finish() al acabar"""
+    return StartupProfile(page)
+
+
+_timed_import.__wrapped__ = _original_import
+
+if ENABLED:
+    builtins.__import__ = _timed_import
@@ -0,0 +1,46 @@
+import re
+import unicodedata
+from functools import lru_cache
+
+# Resultados reales de las preguntas de la porra, una fila por 'Pregunta' en la tabla
+# 'Results'. 'Alias' son otras formas aceptadas de escribir el resultado, separadas
+# por ';' (p.ej. "R. Madrid; Madrid" para "Real Madrid"), y 'Puntos' lo que vale acertar.
+RESULT_COLUMNS = ['Pregunta', 'Resultado', 'Alias', 'Puntos', 'Timestamp']
+ALIAS_SEPARATOR = ";"
+
+
+def normalize(text):
+    """Forma canónica de una respuesta: sin tildes, mayúsculas, puntuación ni espacios de más"""
+    if text is None or text != text:  # None o NaN
+        return ""
+    text = unicodedata.normalize("NFKD", str(text))
+    text = "".join(c for c in text if not unicodedata.combining(c)).casefold()
+    return " ".join(re.sub(r"[^\w]+", " ", text).split())
+
+
+def _points(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 1.0
+
+
+def results_key(results):
+    """Filas de 'Results' como tupla hashable (Pregunta, Resultado, Alias, Puntos), para cachear"""
+    rows = results.reindex(columns=RESULT_COLUMNS[:4]).astype(object)
+    return tuple(tuple("" if v is None or v != v else v for v in row) for row in rows.itertuples(index=False))
+
+
+@lru_cache(maxsize=32)
+def alias_index(key):
+    """Pregunta -> (respuestas aceptadas normalizadas, puntos), a partir de results_key(...).
+
+    Las preguntas sin resultado no aparecen. Memoizado: solo se reconstruye si cambian los resultados.
+    """
+    index = {}
+    for question, answer, aliases, points in key:
+        accepted = {normalize(answer)} | {normalize(alias) for alias in str(aliases).split(ALIAS_SEPARATOR)}
+        accepted.discard("")
+        if question and normalize(answer):
+            index[question] = (frozenset(accepted), _points(points))
+    return index
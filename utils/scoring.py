@@ -0,0 +1,92 @@
+import threading
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from utils.insights import GROUP_COLUMNS, WORLD_COLUMNS, content_hash
+from utils.metrics import metrics, timed
+from utils.results import alias_index, normalize, results_key
+
+# Preguntas que se puntúan: la porra mundial (paso 3) y las votaciones de grupo (paso 4)
+SCORED_COLUMNS = WORLD_COLUMNS + GROUP_COLUMNS
+
+
+class ScoringEngine:
+    """Puntos de todos los jugadores × preguntas en una matriz NumPy.
+
+    Las respuestas de cada pregunta se normalizan una sola vez (por valor distinto, no
+    por jugador); al cambiar un resultado solo se recalcula la columna de esa pregunta.
+    """
+
+    def __init__(self, predictions):
+        self.lock = threading.RLock()
+        self.players = predictions['Jugador'].astype(str).to_numpy()
+        self.questions = [q for q in SCORED_COLUMNS if q in predictions.columns]
+        self.answers = []  # por pregunta: (código de cada jugador, respuestas distintas normalizadas)
+        for question in self.questions:
+            codes, uniques = pd.factorize(predictions[question])
+            self.answers.append((codes, [normalize(u) for u in uniques]))
+        self.points = np.zeros((len(self.players), len(self.questions)))
+        self.hits = np.zeros((len(self.players), len(self.questions)), dtype=bool)
+        self.scored = [None] * len(self.questions)  # (aceptadas, puntos) con que se calculó cada columna
+
+    def _score_column(self, j, accepted):
+        codes, uniques = self.answers[j]
+        # Acierto por respuesta distinta y un False final para las vacías (código -1)
+        correct = np.fromiter((u in accepted for u in uniques), dtype=bool, count=len(uniques))
+        return np.append(correct, False)[codes]
+
+    def update(self, results):
+        """Aplica los resultados y devuelve las preguntas que se han recalculado"""
+        index = alias_index(results_key(results))
+        changed = []
+        with self.lock:
+            for j, question in enumerate(self.questions):
+                scored = index.get(question)
+                if scored == self.scored[j]:
+                    continue
+                accepted, points = scored or (frozenset(), 0.0)
+                self.hits[:, j] = self._score_column(j, accepted)
+                self.points[:, j] = self.hits[:, j] * points
+                self.scored[j] = scored
+                changed.append(question)
+        return changed
+
+    def leaderboard(self):
+        """Clasificación: Puesto, Jugador, Puntos y Aciertos, de más a menos puntos"""
+        with self.lock:
+            board = pd.DataFrame({
+                'Jugador': self.players,
+                'Puntos': self.points.sum(axis=1),
+                'Aciertos': self.hits.sum(axis=1),
+            })
+            resolved = sum(scored is not None for scored in self.scored)
+        board = board.sort_values(['Puntos', 'Jugador'], ascending=[False, True], kind='stable')
+        board.insert(0, 'Puesto', board['Puntos'].rank(method='min', ascending=False).astype(int))
+        board.attrs['resueltas'] = resolved
+        board.attrs['preguntas'] = len(self.questions)
+        return board.reset_index(drop=True)
+
+
+@st.cache_resource(max_entries=4)
+def _cached_engine(digest, _predictions):
+    metrics.cache_miss("clasificación")
+    return ScoringEngine(_predictions)
+
+
+def scoring_engine(predictions):
+    """ScoringEngine de estas predicciones, memoizado por las columnas que se puntúan"""
+    scored = predictions.reindex(columns=['Jugador'] + [q for q in SCORED_COLUMNS if q in predictions.columns])
+    metrics.cache_lookup("clasificación")
+    return _cached_engine(content_hash(scored), scored)
+
+
+@timed("clasificación.leaderboard")
+def leaderboard(predictions, results):
+    """Clasificación actual (solo recalcula las preguntas cuyo resultado ha cambiado)"""
+    engine = scoring_engine(predictions)
+    # El motor es compartido: actualizar y leer de una vez, sin mezclar resultados de otra sesión
+    with engine.lock:
+        engine.update(results)
+        return engine.leaderboard()
@@ -0,0 +1,246 @@
+import itertools
+import threading
+
+import streamlit as st
+import pandas as pd
+from gspread.exceptions import WorksheetNotFound
+from gspread.utils import a1_to_rowcol, rowcol_to_a1
+from streamlit_gsheets import GSheetsConnection
+
+from utils.database import RequestScheduler, StorageBackend
+from utils.opinions import OPINION_COLUMNS
+from utils.results import RESULT_COLUMNS
+
+
+class _SheetIndex:
+    """Índice cacheado de una pestaña: cabecera y clave -> nº de fila (1 = cabecera)"""
+
+    def __init__(self, keys):
+        self.keys = keys
+        self.header = None
+        self.rows = {}
+
+    def key(self, values):
+        return tuple(values.get(k) for k in self.keys)
+
+
+class SheetsBackend(StorageBackend):
+    """Almacenamiento en Google Sheets (pestañas 'Players', 'Predictions', 'Opinions' y 'Results').
+
+    `connection` es el nombre de [connections.<nombre>] en secrets.toml y `prefix` se
+    antepone a cada pestaña, para que varios grupos compartan hoja ('npm_Players'...).
+    """
+
+    def __init__(self, scheduler=None, connection="gsheets", prefix=""):
+        self.conn = st.connection(connection, type=GSheetsConnection)
+        self.scheduler = scheduler or RequestScheduler()
+        self.prefix = prefix
+        self.lock = threading.Lock()
+        self.worksheets = {}
+        self.writes = {}  # pestaña -> nº de la última escritura (ver _read)
+        self.indexes = {
+            "Predictions": _SheetIndex(['Jugador']),
+            "Opinions": _SheetIndex(['Autor', 'Sujeto']),
+            "Results": _SheetIndex(['Pregunta']),
+        }
+
+    def _read(self, worksheet):
+        """Descarga una pestaña (lecturas simultáneas de la misma pestaña se fusionan).
+
+        Solo se fusionan lecturas empezadas después de la última escritura en la pestaña:
+        una lectura que empezó antes no puede devolver datos viejos a quien acaba de escribir.
+        """
+        title = self.prefix + worksheet
+        try:
+            return self.scheduler.call(self.conn.read, worksheet=title, ttl=0,
+                                       merge_key=("read", title, self.writes.get(worksheet)))
+        except WorksheetNotFound:
+            return pd.DataFrame()
+
+    def _written(self, worksheet):
+        self.writes[worksheet] = next(_write_count)
+
+    def get_players(self):
+        df = self._read("Players")
+        return df['Nombre'].dropna().tolist() if not df.empty else []
+
+    def save_player(self, name):
+        df = self._read("Players")
+        if df.empty:
+            df = pd.DataFrame(columns=["Nombre"])
+        if name not in df['Nombre'].tolist():
+            new_row = pd.DataFrame([{"Nombre": name}])
+            df = pd.concat([df, new_row], ignore_index=True)
+            # Worksheet en vez de nombre: la pestaña de un grupo nuevo aún no existe
+            with self.lock:
+                ws = self._worksheet("Players")
+            try:
+                self.scheduler.call(self.conn.update, worksheet=ws, data=df)
+            finally:
+                self._written("Players")
+
+    def save_prediction(self, data):
+        self.save_predictions([data])
+
+    def save_predictions(self, rows):
+        self._upsert("Predictions", rows)
+
+    def save_opinions(self, rows):
+        self._upsert("Opinions", rows)
+
+    def save_results(self, rows):
+        self._upsert("Results", rows)
+
+    def _upsert(self, name, rows):
+        """Upsert por filas: escribe solo las celdas recibidas en la fila de cada clave
+        (una única petición batch) y añade las filas nuevas, sin descargar ni reescribir la hoja"""
+        index = self.indexes[name]
+        with self.lock:
+            ws = self._worksheet(name)
+            try:
+                self._upsert_rows(ws, index, rows)
+            except Exception:
+                # El índice puede estar desfasado (p.ej. filas editadas a mano): se reconstruye
+                index.header = None
+                raise
+            finally:
+                # También si falla: puede haberse escrito una parte
+                self._written(name)
+
+    def _worksheet(self, name):
+        """Worksheet de gspread tras la conexión (requiere cuenta de servicio); la crea si no existe"""
+        if name not in self.worksheets:
+            try:
+                ws = self.scheduler.call(self.conn.client._select_worksheet, worksheet=self.prefix + name)
+            except WorksheetNotFound:
+                spreadsheet = self.scheduler.call(self.conn.client._open_spreadsheet)
+                ws = self.scheduler.call(spreadsheet.add_worksheet, title=self.prefix + name, rows=1000, cols=10)
+            self.worksheets[name] = ws
+        return self.worksheets[name]
+
+    def _load_index(self, ws, index):
+        """Lee solo la cabecera y las columnas clave para mapear clave -> nº de fila"""
+        header = self.scheduler.call(ws.row_values, 1)
+        rows = {}
+        if all(k in header for k in index.keys):
+            columns = [self.scheduler.call(ws.col_values, header.index(k) + 1) for k in index.keys]
+            length = max(len(c) for c in columns)
+            columns = [c + [""] * (length - len(c)) for c in columns]
+            rows = {key: i + 1 for i, key in enumerate(zip(*columns)) if i > 0 and any(key)}
+        index.header, index.rows = header, rows
+
+    def _index_matches(self, ws, index, rows):
+        """True si la cabecera y la fila de cada clave siguen como dice el índice (un solo batch_get)"""
+        keys = [key for key in dict.fromkeys(index.key(values) for values in rows) if key in index.rows]
+        columns = [index.header.index(k) + 1 for k in index.keys]
+        ranges = ["1:1"] + [rowcol_to_a1(index.rows[key], col) for key in keys for col in columns]
+        header, *cells = self.scheduler.call(ws.batch_get, ranges)
+        if (header[0] if header else []) != index.header:
+            return False
+        found = [str(cell[0][0]) if cell and cell[0] else "" for cell in cells]
+        return found == [str(part) for key in keys for part in key]
+
+    def _upsert_rows(self, ws, index, rows):
+        rows = [{key: _cell(value) for key, value in data.items()} for data in rows]
+
+        fresh = index.header is None
+        if fresh:
+            self._load_index(ws, index)
+        elif any(index.key(values) not in index.rows for values in rows):
+            # Otra sesión/proceso puede haber añadido su fila: se relee el índice antes de duplicarla
+            self._load_index(ws, index)
+        elif not self._index_matches(ws, index, rows):
+            # Filas borradas, ordenadas o insertadas a mano: escribir ahora pisaría otra fila
+            self._load_index(ws, index)
+
+        columns = list(dict.fromkeys(key for values in rows for key in values))
+        if not index.header:
+            # Hoja vacía: cabecera y filas en una sola petición
+            self.scheduler.call(ws.append_rows,
+                                [columns] + [[values.get(k, "") for k in columns] for values in rows],
+                                value_input_option="RAW")
+            index.header = columns
+            index.rows = {index.key(values): i + 2 for i, values in enumerate(rows)}
+            return
+
+        new_columns = [key for key in columns if key not in index.header]
+        header = index.header + new_columns
+        if len(header) > ws.col_count:
+            self.scheduler.call(ws.add_cols, len(header) - ws.col_count)
+
+        # Filas existentes (y cabeceras nuevas): solo sus celdas, en un único batchUpdate
+        cells = [
+            {"range": rowcol_to_a1(1, header.index(key) + 1), "values": [[key]]}
+            for key in new_columns
+        ]
+        appended = []
+        for values in rows:
+            row = index.rows.get(index.key(values))
+            if row is None:
+                appended.append(values)
+                continue
+            cells += [
+                {"range": rowcol_to_a1(row, header.index(key) + 1), "values": [[value]]}
+                for key, value in values.items()
+            ]
+        if cells:
+            self.scheduler.call(ws.batch_update, cells, value_input_option="RAW")
+
+        # Filas nuevas: append atómico en el servidor, sin calcular la fila a mano
+        if appended:
+            result = self.scheduler.call(ws.append_rows,
+                                         [[values.get(k, "") for k in header] for values in appended],
+                                         value_input_option="RAW", table_range="A1")
+            updated = result["updates"]["updatedRange"].split("!")[-1].split(":")[0]
+            first_row = a1_to_rowcol(updated)[0]
+            for i, values in enumerate(appended):
+                index.rows[index.key(values)] = first_row + i
+        index.header = header
+
+    def get_all_predictions(self):
+        return self._read("Predictions")
+
+    def get_opinions(self):
+        df = self._read("Opinions")
+        return df if not df.empty else pd.DataFrame(columns=OPINION_COLUMNS)
+
+    def get_results(self):
+        df = self._read("Results")
+        return df if not df.empty else pd.DataFrame(columns=RESULT_COLUMNS)
+
+    def drop_prediction_columns(self, columns):
+        # Operación puntual (migración): borra solo esas columnas, sin reescribir la hoja, para
+        # no pisar lo que otra sesión o proceso escriba mientras tanto. Los demás procesos ven
+        # la cabecera cambiada antes de su siguiente escritura (_index_matches) y releen el índice.
+        with self.lock:
+            ws = self._worksheet("Predictions")
+            header = self.scheduler.call(ws.row_values, 1)
+            positions = sorted(header.index(c) + 1 for c in set(columns) if c in header)
+            # Tramos de columnas contiguas, de derecha a izquierda para no mover los pendientes
+            runs = []
+            for col in positions:
+                if runs and runs[-1][1] == col - 1:
+                    runs[-1][1] = col
+                else:
+                    runs.append([col, col])
+            try:
+                for start, end in reversed(runs):
+                    self.scheduler.call(ws.delete_columns, start, end)
+            finally:
+                self._written("Predictions")
+            self.indexes["Predictions"].header = None
+
+    def close(self):
+        # st.connection (la misma para todos los grupos que la usan) vuelve a autenticarse
+        # en el siguiente acceso
+        self.conn.reset()
+
+
+_write_count = itertools.count(1)  # global: una conexión nueva no repite números de la anterior
+
+
+def _cell(value):
+    """Valor listo para una celda de Sheets (vacíos y NaN como cadena vacía)"""
+    if value is None or (isinstance(value, float) and pd.isna(value)):
+        return ""
+    return value
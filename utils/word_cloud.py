@@ -0,0 +1,42 @@
+import io
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.metrics import metrics, timed
+
+# Un único hilo de fondo para todo el proceso: la maquetación de la nube es costosa
+# y no debe bloquear el hilo del script de Streamlit
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="porra-wordcloud")
+_lock = threading.Lock()
+_renders = OrderedDict()  # frecuencias -> Future con el PNG
+MAX_RENDERS = 8
+RENDER_TIMEOUT = 20  # segundos que la página espera a la nube antes de seguir sin ella
+
+
+@timed("nube.render")
+def render_word_cloud(frequencies):
+    """PNG de la nube de palabras a partir de frecuencias ya calculadas (sin re-tokenizar)"""
+    from wordcloud import WordCloud
+
+    wordcloud = WordCloud(width=800, height=400, background_color='black',
+                          colormap='magma', max_words=50).generate_from_frequencies(frequencies)
+    buf = io.BytesIO()
+    wordcloud.to_image().save(buf, format='PNG')
+    return buf.getvalue()
+
+
+def word_cloud_png(frequencies):
+    """Future con el PNG de la nube, memoizado por frecuencias y calculado en segundo plano"""
+    key = tuple(sorted(frequencies.items()))
+    with _lock:
+        future = _renders.get(key)
+        if future is not None and not (future.done() and future.exception() is not None):
+            _renders.move_to_end(key)
+            metrics.cache_lookup("nube", hit=True)
+            return future
+        metrics.cache_lookup("nube", hit=False)
+        future = _renders[key] = _executor.submit(render_word_cloud, dict(frequencies))
+        if len(_renders) > MAX_RENDERS:
+            _renders.popitem(last=False)
+    return future
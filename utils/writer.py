@@ -0,0 +1,102 @@
+import atexit
+import threading
+
+
+class WriteBehindQueue:
+    """Cola de escritura diferida para los autoguardados del asistente.
+
+    `submit` solo deja el estado en memoria y vuelve al instante. Un hilo en
+    segundo plano agrupa lo pendiente y lo guarda por lotes con `save(rows)`.
+    Los guardados del mismo 'Jugador' se fusionan, así que solo se escribe su
+    último estado. `flush` fuerza la escritura y espera a que sea durable.
+    """
+
+    def __init__(self, save, interval=1.0, retry_delay=5.0):
+        self.save = save
+        self.interval = interval
+        self.retry_delay = retry_delay
+        self.cond = threading.Condition()
+        self.pending = {}    # Jugador -> campos a guardar (fusionados)
+        self.in_flight = {}  # lote que se está escribiendo ahora mismo
+        self.errors = {}     # Jugador -> último error de escritura
+        self.urgent = False
+        self.closed = False
+        self.thread = None
+
+    def submit(self, data):
+        """Encola una copia de data; sobrescribe los campos pendientes del mismo jugador"""
+        jugador = data.get('Jugador')
+        with self.cond:
+            self.pending[jugador] = {**self.pending.get(jugador, {}), **data}
+            self.closed = False
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name="porra-writer", daemon=True)
+                self.thread.start()
+                atexit.register(self.flush, timeout=10)
+            self.cond.notify_all()
+
+    def flush(self, jugador=None, timeout=30):
+        """Escribe ya lo pendiente (de `jugador` o de todos) y espera a que termine.
+
+        Lanza el error de escritura si falla, o TimeoutError si no acaba a tiempo.
+        """
+        def written():
+            if jugador is None:
+                return not self.pending and not self.in_flight
+            return jugador not in self.pending and jugador not in self.in_flight
+
+        def failed():
+            if jugador is None:
+                return bool(self.errors)
+            return jugador in self.errors
+
+        with self.cond:
+            if jugador is None:
+                self.errors.clear()
+            else:
+                self.errors.pop(jugador, None)
+            self.urgent = True
+            self.cond.notify_all()
+            if not self.cond.wait_for(lambda: written() or failed(), timeout):
+                raise TimeoutError("El guardado en segundo plano no terminó a tiempo")
+            if not written():
+                raise next(iter(self.errors.values())) if jugador is None else self.errors[jugador]
+
+    def close(self, timeout=10):
+        """Escribe lo pendiente y para el hilo (lanza el error si no se pudo escribir)"""
+        self.flush(timeout=timeout)
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+        atexit.unregister(self.flush)
+
+    def _run(self):
+        while True:
+            with self.cond:
+                self.cond.wait_for(lambda: self.pending or self.closed)
+                if not self.pending:
+                    self.thread = None
+                    return
+                # Margen para agrupar varios guardados en un mismo lote (salvo flush)
+                self.cond.wait_for(lambda: self.urgent, self.interval)
+                self.urgent = False
+                batch, self.pending, self.in_flight = self.pending, {}, self.pending
+
+            try:
+                self.save(list(batch.values()))
+                error = None
+            except Exception as e:
+                error = e
+
+            with self.cond:
+                self.in_flight = {}
+                for jugador, data in batch.items():
+                    if error is None:
+                        self.errors.pop(jugador, None)
+                    else:
+                        # Se reencola por debajo de lo que haya llegado mientras tanto
+                        self.pending[jugador] = {**data, **self.pending.get(jugador, {})}
+                        self.errors[jugador] = error
+                self.cond.notify_all()
+                if error is not None:
+                    self.cond.wait_for(lambda: self.urgent, self.retry_delay)